@@ -0,0 +1,34 @@
+"""added channelMediaGroupId to message mappings
+
+Revision ID: c3e5a7b9d1f2
+Revises: b2d4e6f8a0c1
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c3e5a7b9d1f2'
+down_revision: Union[str, None] = 'b2d4e6f8a0c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('message_mappings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('channelMediaGroupId', sa.String(length=64), nullable=True))
+        batch_op.create_index(
+            'ix_message_mappings_channel_media_group',
+            ['channelChatId', 'channelMediaGroupId'],
+            unique=False,
+            postgresql_where=sa.text('"channelMediaGroupId" IS NOT NULL')
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('message_mappings', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_mappings_channel_media_group')
+        batch_op.drop_column('channelMediaGroupId')
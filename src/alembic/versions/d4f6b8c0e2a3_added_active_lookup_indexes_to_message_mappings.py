@@ -0,0 +1,58 @@
+"""added partial composite lookup indexes to message mappings
+
+Revision ID: d4f6b8c0e2a3
+Revises: c3e5a7b9d1f2
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd4f6b8c0e2a3'
+down_revision: Union[str, None] = 'c3e5a7b9d1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name -> (columns, where) - built CONCURRENTLY so a large message_mappings table stays writable
+INDEXES = {
+    'ix_message_mappings_user_message_active': (
+        ['userChatId', 'userMessageId'],
+        '"isDeleted" = false',
+    ),
+    'ix_message_mappings_user_last_edit_active': (
+        ['userChatId', 'userLastEditMessageId'],
+        '"isDeleted" = false AND "userLastEditMessageId" IS NOT NULL',
+    ),
+    'ix_message_mappings_channel_message_active': (
+        ['channelChatId', 'channelMessageId'],
+        '"isDeleted" = false',
+    ),
+}
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, (columns, where) in INDEXES.items():
+            op.create_index(
+                name,
+                'message_mappings',
+                columns,
+                unique=False,
+                postgresql_where=sa.text(where),
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(
+                name,
+                table_name='message_mappings',
+                postgresql_concurrently=True,
+                if_exists=True
+            )
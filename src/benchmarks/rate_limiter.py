@@ -0,0 +1,110 @@
+"""
+rate limiter benchmark :: legacy (zset, 5 separate calls) vs atomic sliding window vs token bucket
+
+run from src/ against a scratch redis (uses user ids from 9_000_000_000 up, cleaned afterwards):
+    python -m benchmarks.rate_limiter --redis-url redis://localhost:6379/15
+
+reports per-attempt latency (p50/p99), throughput and how many of N concurrent
+attempts from one user got through a limit of L (legacy overshoots, atomic ones must not)
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import redis.asyncio as redis
+from services.rate_limiting import RateLimiterService, TokenBucketRateLimiter
+
+BASE_USER_ID = 9_000_000_000
+
+class LegacyRateLimiter:
+    """the pre-lua implementation: check (up to 3 calls) and record (2 calls) as separate steps"""
+    def __init__(self, client: redis.Redis, limit: int, window: int):
+        self.redis = client
+        self.limit = limit
+        self.window = window
+
+    def _getKey(self, userId: int) -> str:
+        return f"ratelimit:{userId}:legacy"
+
+    async def acquire(self, userId: int) -> bool:
+        key = self._getKey(userId)
+        currentTime = int(time.time())
+        await self.redis.zremrangebyscore(key, 0, currentTime - self.window)
+        count = await self.redis.zcard(key)
+        if count >= self.limit:
+            await self.redis.zrange(key, 0, 0, withscores=True)
+            return False
+        now = time.time()
+        await self.redis.zadd(key, {str(now): now})
+        await self.redis.expire(key, self.window + 60)
+        return True
+
+async def _acquire(limiter, userId: int) -> bool:
+    result = await limiter.acquire(userId)
+    return result if isinstance(result, bool) else result.allowed
+
+async def benchThroughput(name: str, limiter, users: int, opsPerUser: int, concurrency: int) -> None:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def attempt(userId: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await _acquire(limiter, userId)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        attempt(BASE_USER_ID + idx % users)
+        for idx in range(users * opsPerUser)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<16} {len(latencies) / elapsed:>10.0f} ops/s   "
+        f"p50={statistics.median(latencies):6.2f}ms   p99={p99:6.2f}ms"
+    )
+
+async def benchRace(name: str, limiter, attempts: int, limit: int) -> None:
+    userId = BASE_USER_ID + 999_999
+    results = await asyncio.gather(*(_acquire(limiter, userId) for _ in range(attempts)))
+    allowed = sum(results)
+    verdict = "OK" if allowed <= limit else "OVERSHOOT"
+    print(f"{name:<16} {allowed:>3}/{attempts} concurrent attempts allowed with limit {limit} -> {verdict}")
+
+async def cleanup(client: redis.Redis) -> None:
+    async for key in client.scan_iter(match=f"ratelimit:{str(BASE_USER_ID)[:4]}*"):
+        await client.delete(key)
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=20, help="attempts per user")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--race-attempts", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url, decode_responses=True)
+    window = 60
+    highLimit = args.ops + 1 # throughput run should never be denied
+    try:
+        await cleanup(client)
+        print(f"-- throughput ({args.users} users x {args.ops} attempts, concurrency {args.concurrency})")
+        await benchThroughput("legacy", LegacyRateLimiter(client, highLimit, window), args.users, args.ops, args.concurrency)
+        await benchThroughput("sliding_window", RateLimiterService(client, highLimit, window), args.users, args.ops, args.concurrency)
+        await benchThroughput("token_bucket", TokenBucketRateLimiter(client, highLimit, window, burst=highLimit), args.users, args.ops, args.concurrency)
+        await cleanup(client)
+
+        print(f"-- race ({args.race_attempts} concurrent attempts from one user)")
+        await benchRace("legacy", LegacyRateLimiter(client, args.limit, window), args.race_attempts, args.limit)
+        await benchRace("sliding_window", RateLimiterService(client, args.limit, window), args.race_attempts, args.limit)
+        await benchRace("token_bucket", TokenBucketRateLimiter(client, args.limit, window, burst=args.limit), args.race_attempts, args.limit)
+    finally:
+        await cleanup(client)
+        await client.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,2 +1,3 @@
 from .handlers import *
 from .middlewares import *
+from .webhook import *
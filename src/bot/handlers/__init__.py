@@ -2,3 +2,4 @@ from .callback import *
 from .private import *
 from .settings import *
 from .group import *
+from .membership import *
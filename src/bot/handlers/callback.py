@@ -9,6 +9,7 @@ from common import (
     handleEditErrors,
     buildCancelEditKeyboard,
     buildEditModeMessage,
+    dropPostActions,
 )
 from services import (
     EditService, 
@@ -34,21 +35,26 @@ async def handleDelete(
     redis,
     channelMessageId: int
 ):
-    await bot.delete_message(
-        chat_id=settings.CHANNEL_ID,
-        message_id=channelMessageId
-    )
-    await messageMappingRepo.markAsDeleted(
-        channelChatId=settings.CHANNEL_ID,
-        channelMessageId=channelMessageId
-    )
-    siblingsRaw = await redis.get(f"media_group_siblings:{channelMessageId}")
-    if siblingsRaw:
-        for siblingId in json.loads(siblingsRaw):
-            await bot.delete_message(chat_id=settings.CHANNEL_ID, message_id=siblingId)
-            await messageMappingRepo.markAsDeleted(channelChatId=settings.CHANNEL_ID, channelMessageId=siblingId)
-        await redis.delete(f"media_group_siblings:{channelMessageId}")
-    await callback.message.edit_text("🗑 Message deleted from channel")
+    messageIds = await messageMappingRepo.getAlbumMessageIds(settings.CHANNEL_ID, channelMessageId)
+    if not messageIds:
+        # albums posted before channelMediaGroupId existed - the legacy key expires 7 days after posting
+        siblingsRaw = await redis.get(f"media_group_siblings:{channelMessageId}")
+        if siblingsRaw:
+            messageIds = [channelMessageId, *json.loads(siblingsRaw)]
+            await redis.delete(f"media_group_siblings:{channelMessageId}")
+    if len(messageIds) > 1:
+        # whole album in one call (albums are <= 10 items, delete_messages takes up to 100)
+        await bot.delete_messages(chat_id=settings.CHANNEL_ID, message_ids=messageIds)
+    else:
+        messageIds = [channelMessageId]
+        await bot.delete_message(chat_id=settings.CHANNEL_ID, message_id=channelMessageId)
+    await messageMappingRepo.markAsDeletedBulk(settings.CHANNEL_ID, messageIds)
+    # merged confirmations keep the rows of the other posts
+    remaining = dropPostActions(callback.message.reply_markup, channelMessageId)
+    if remaining:
+        await callback.message.edit_reply_markup(reply_markup=remaining)
+    else:
+        await callback.message.edit_text("🗑 Message deleted from channel")
 
 @router.callback_query(F.data.startswith("comment_delete"))
 async def handleCommentDelete(
@@ -67,7 +73,7 @@ async def handleCommentDelete(
         await callback.answer("❌ Comment not found or already deleted", show_alert=True)
         return
 
-    user = await userRepo.getByTelegramId(callback.from_user.id)
+    user = await userRepo.getSnapshot(callback.from_user.id)
     if not user or (mapping.userId != user.id and not user.isAdmin):
         await callback.answer("❌ You can only delete your own comments", show_alert=True)
         return
@@ -98,7 +104,7 @@ async def handleCommentEditRequest(
         await callback.answer("❌ Comment not found or already deleted", show_alert=True)
         return
 
-    user = await userRepo.getByTelegramId(callback.from_user.id)
+    user = await userRepo.getSnapshot(callback.from_user.id)
     if not user or mapping.userId != user.id:
         await callback.answer("❌ You can only edit your own comments", show_alert=True)
         return
@@ -255,6 +261,7 @@ async def _handleNSFWDecision(
             originalUserMessageId=singleMediaData['messageId'],
             forceQuoteText=singleMediaData.get('quoteText')
         )
+        await messageForwarder.recordPost(callback.from_user.id)
         await nsfwDataManager.deleteSingleMedia(messageId)
         await callback.message.delete()
         await callback.answer()
@@ -265,14 +272,11 @@ async def _handleNSFWDecision(
         await callback.answer("❌ Request expired", show_alert=True)
         return
     
-    messageIds = [
-        {
-            'messageId': messageId,
-            'chatId': mediaGroupData['chatId'],
-            'userId': mediaGroupData['userId']
-        }
-        for messageId in mediaGroupData['messageIds']
-    ]
+    # buffered album items (file ids, captions) - the album is rebuilt without refetching messages
+    messageIds = mediaGroupData.get('items')
+    if not messageIds:
+        await callback.answer("❌ Request expired", show_alert=True)
+        return
     user = await messageForwarder.userRepo.getById(mediaGroupData['userId'])
     await mediaGroupHandler.sendToChannel(
         messageIds,
@@ -0,0 +1,27 @@
+from aiogram import Router, F
+from aiogram.types import ChatMemberUpdated
+from services.subscription_checker import SubscriptionCheckerService
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+router = Router(name="membership")
+
+@router.chat_member(F.chat.id == settings.CHANNEL_ID)
+async def handleChannelMembership(
+    event: ChatMemberUpdated,
+    subscriptionChecker: SubscriptionCheckerService
+):
+    """
+    keeps the subscription status cache in sync with the channel
+    (!NOTE bot must be a channel admin to receive chat_member updates)
+    the update already carries the new status, so it's written straight into the cache
+    instead of just dropping the key and paying a get_chat_member on the next message
+    """
+    telegramId = event.new_chat_member.user.id
+    status = SubscriptionCheckerService.statusFromMember(event.new_chat_member.status)
+    await subscriptionChecker.cacheStatus(telegramId, status)
+    logger.info(
+        f"[SUB_CACHE] membership change for user {telegramId}: "
+        f"{event.old_chat_member.status} -> {event.new_chat_member.status} (cached as {status})"
+    )
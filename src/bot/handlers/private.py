@@ -3,6 +3,7 @@ from aiogram.types import Message
 from aiogram.enums import ChatType
 from aiogram.filters import CommandStart, Command
 from common import checkUserNotBanned, handleMessageErrors, settings
+from db import UserRepository
 from services import MessageForwarderService, EditService, AnonCommentService
 from exceptions import BotException, RateLimitExceeded, NotSubscribedError
 import logging
@@ -40,7 +41,8 @@ async def handleAnon(message: Message, anonCommentService: AnonCommentService):
 async def handleMessage(
     message: Message,
     messageForwarder: MessageForwarderService,
-    editService: EditService
+    editService: EditService,
+    userRepo: UserRepository, # consumed by checkUserNotBanned
 ):
     if message.from_user.id == 777000 or message.from_user.is_bot: return
     wasEdited = await editService.processEdit(message)
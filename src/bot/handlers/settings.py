@@ -1,4 +1,4 @@
-from aiogram import Router, Bot, F
+from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
 from aiogram.enums import ChatType
@@ -6,7 +6,6 @@ from db import UserRepository
 from services.subscription_checker import SubscriptionCheckerService
 from common import AliasValidator
 from exceptions import AliasValidationError, AliasTakenError, NotSubscribedError
-from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,9 +22,13 @@ SETTINGS_HELP = (
 )
 
 @router.message(Command("settings"), F.chat.type == ChatType.PRIVATE)
-async def handleSettings(message: Message, bot: Bot, userRepo: UserRepository):
+async def handleSettings(
+    message: Message,
+    userRepo: UserRepository,
+    subscriptionChecker: SubscriptionCheckerService
+):
     try:
-        user = await userRepo.getOrCreate(
+        user = await userRepo.ensureUser(
             telegramId=message.from_user.id,
             username=message.from_user.username,
             firstName=message.from_user.first_name or "",
@@ -42,7 +45,7 @@ async def handleSettings(message: Message, bot: Bot, userRepo: UserRepository):
             return
 
         if args[0] == "alias":
-            await _handleAliasCommand(message, bot, userRepo, user, args[1:])
+            await _handleAliasCommand(message, userRepo, subscriptionChecker, user, args[1:])
             return
 
         await message.answer(
@@ -59,7 +62,13 @@ async def handleSettings(message: Message, bot: Bot, userRepo: UserRepository):
         logger.error(f"[SETTINGS] unexpected error for user {message.from_user.id}: {e}", exc_info=True)
 
 
-async def _handleAliasCommand(message: Message, bot: Bot, userRepo: UserRepository, user, args: list):
+async def _handleAliasCommand(
+    message: Message,
+    userRepo: UserRepository,
+    subscriptionChecker: SubscriptionCheckerService,
+    user,
+    args: list
+):
     if not args:
         aliasDisplay = f"<code>{user.alias}</code>" if user.alias else "<i>not set</i>"
         await message.answer(
@@ -79,7 +88,6 @@ async def _handleAliasCommand(message: Message, bot: Bot, userRepo: UserReposito
         await message.answer("😖 Alias removed 😩")
         return
 
-    subscriptionChecker = SubscriptionCheckerService(bot, settings.CHANNEL_ID)
     isSubscribed, subStatus = await subscriptionChecker.isSubscribed(message.from_user.id)
     if not isSubscribed:
         raise NotSubscribedError(status=subStatus)
@@ -1,29 +1,23 @@
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
-from config import dbManager
-from db import (
-    UserRepository, 
-    MessageMappingRepository, 
-    CommentMappingRepository, 
-    ChannelThreadMappingRepository
-)
-from services import (
-    MessageForwarderService,
-    ReplyResolverService,
-    EditService,
-    AnonCommentService,
-)
+from services import ServiceContainer
 
 class SessionMiddleware(BaseMiddleware):
     """
-    per-request SessionMiddleware opens a DB session and builds
-    session scoped services each update, reading singletons from dp
+    per-request SessionMiddleware builds a lazy ServiceContainer each update,
+    reading singletons from dp
     
-    so session scoped services are not registered globally 
-    as *global-single-instance-deps*(singletons) but only when requested
+    only the deps the matched handler actually declares get resolved
+    (aiogram already unwraps decorators, so handler.params is the real signature);
+    handlers taking **kwargs get everything. guards that need a dep
+    (e.g. checkUserNotBanned -> userRepo) rely on the handler declaring it
+
+    the DB session is opened only if something asks for it and
+    committed only if it was actually used
     
-    singleton dependencies (redis, rateLimiter,nsfwChecker)
+    singleton dependencies (redis, rateLimiter,nsfwChecker, subscriptionChecker, mediaGroupCoordinator,
+        confirmationService, mappingCache, activityTracker, userSnapshotCache)
         are registered in main.py via Dispatcher and are already available in `data` -
         we just read them here, not having to re-create them
     """
@@ -33,42 +27,29 @@ class SessionMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        async with dbManager.session() as session:
-            bot = data.get("bot")
-            redis = data.get("redis")
-            nsfwChecker = data.get("nsfwChecker")
-            rateLimiter = data.get("rateLimiter")
+        container = ServiceContainer(
+            bot=data.get("bot"),
+            redis=data.get("redis"),
+            rateLimiter=data.get("rateLimiter"),
+            nsfwChecker=data.get("nsfwChecker"),
+            subscriptionChecker=data.get("subscriptionChecker"),
+            mediaGroupCoordinator=data.get("mediaGroupCoordinator"),
+            confirmationService=data.get("confirmationService"),
+            mappingCache=data.get("mappingCache"),
+            activityTracker=data.get("activityTracker"),
+            userSnapshotCache=data.get("userSnapshotCache"),
+        )
+        handlerObject = data.get("handler")
+        if handlerObject is None or handlerObject.varkw:
+            container.inject(data, ServiceContainer.PROVIDED)
+        else:
+            container.inject(data, handlerObject.params)
 
-            userRepo = UserRepository(session)
-            messageMappingRepo = MessageMappingRepository(session)
-            commentMappingRepo = CommentMappingRepository(session)
-            channelThreadRepo = ChannelThreadMappingRepository(session)
-            replyResolver = ReplyResolverService(bot, messageMappingRepo)
-            editService = EditService(bot, redis, messageMappingRepo)
-            messageForwarder = MessageForwarderService(
-                bot,
-                userRepo,
-                messageMappingRepo,
-                replyResolver,
-                rateLimiter,
-                nsfwChecker,
-                redis
-            )
-            anonCommentService = AnonCommentService(
-                bot,
-                userRepo,
-                commentMappingRepo,
-                channelThreadRepo,
-            )
-            data["session"] = session
-            data["userRepo"] = userRepo
-            data["editService"] = editService
-            data["replyResolver"] = replyResolver
-            data["messageForwarder"] = messageForwarder
-            data["mediaGroupHandler"] = messageForwarder.mediaGroupHandler
-            data["messageMappingRepo"] = messageMappingRepo
-            data["commentMappingRepo"] = commentMappingRepo
-            data["channelThreadRepo"] = channelThreadRepo
-            data["anonCommentService"] = anonCommentService
-            return await handler(event, data)
+        try:
+            result = await handler(event, data)
+        except Exception:
+            await container.close(failed=True)
+            raise
+        await container.close()
+        return result
         
\ No newline at end of file
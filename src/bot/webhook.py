@@ -0,0 +1,149 @@
+import asyncio
+import hmac
+import logging
+import signal
+from contextlib import suppress
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from config import settings, dbManager
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """
+    webhook ingestion mode - aiohttp server feeding updates into the SAME
+    Dispatcher used for polling (routers, middlewares, dp singletons untouched)
+
+    request handler only checks the secret token and enqueues the raw update,
+    so telegram gets its 200 right away; a fixed set of workers drains the
+    bounded queue through dp.feed_raw_update
+    - secret mismatch -> 401 (WEBHOOK_SECRET is required, the server won't start without it)
+    - queue full      -> 503, telegram redelivers later (backpressure instead of unbounded memory)
+
+    stateless per replica -> several replicas can sit behind a load balancer
+    """
+    def __init__(self, bot: Bot, dp: Dispatcher):
+        if not settings.WEBHOOK_SECRET:
+            # without it anyone who finds the url can feed the bot forged updates
+            raise RuntimeError("WEBHOOK_SECRET must be set when BOT_MODE=webhook")
+        self.bot = bot
+        self.dp = dp
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WEBHOOK_QUEUE_SIZE)
+        self._workers: list[asyncio.Task] = []
+        self._stopEvent = asyncio.Event()
+
+    async def run(self) -> None:
+        app = web.Application()
+        app.router.add_post(settings.WEBHOOK_PATH, self._handleUpdate)
+        app.router.add_get("/healthz", self._handleHealth)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT)
+
+        self._installSignalHandlers()
+        self._workers = [
+            asyncio.create_task(self._worker(idx), name=f"webhook-worker-{idx}")
+            for idx in range(settings.WEBHOOK_WORKERS)
+        ]
+        try:
+            await self.dp.emit_startup(bot=self.bot, **self.dp.workflow_data)
+            await site.start()
+            logger.info(
+                f"[WEBHOOK] listening on {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH} "
+                f"(workers={settings.WEBHOOK_WORKERS}, queueSize={settings.WEBHOOK_QUEUE_SIZE})"
+            )
+            if settings.WEBHOOK_URL and settings.WEBHOOK_SET_ON_STARTUP:
+                await self._registerWebhook()
+            await self._stopEvent.wait()
+        finally:
+            logger.info("[WEBHOOK] stopping - no longer accepting updates")
+            await runner.cleanup()
+            await self._drainQueue()
+            await self.dp.emit_shutdown(bot=self.bot, **self.dp.workflow_data)
+
+    def stop(self) -> None:
+        self._stopEvent.set()
+
+    async def _registerWebhook(self) -> None:
+        url = settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH
+        await self.bot.set_webhook(
+            url=url,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=False,
+        )
+        logger.info(f"[WEBHOOK] webhook registered: {url}")
+
+    async def _handleUpdate(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_TOKEN_HEADER, "")
+        if not hmac.compare_digest(token.encode(), settings.WEBHOOK_SECRET.encode()):
+            logger.warning(f"[WEBHOOK] rejected update with bad secret token from {request.remote}")
+            return web.Response(status=401)
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(payload, dict):
+            logger.warning(f"[WEBHOOK] rejected non-object update payload from {request.remote}")
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            logger.warning(
+                f"[WEBHOOK] queue full ({self.queue.qsize()}), "
+                f"rejecting update {payload.get('update_id')} - telegram will retry"
+            )
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _handleHealth(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "queued": self.queue.qsize(),
+            "queueSize": self.queue.maxsize,
+            "dbPool": dbManager.getPoolStats(),
+            "backgroundTasks": self.dp["taskSupervisor"].stats() if "taskSupervisor" in self.dp.workflow_data else None,
+            "outbound": self.dp["outboundScheduler"].stats() if "outboundScheduler" in self.dp.workflow_data else None,
+            "mappingCache": self.dp["mappingCache"].stats() if "mappingCache" in self.dp.workflow_data else None,
+            "userActivity": self.dp["activityTracker"].stats() if "activityTracker" in self.dp.workflow_data else None,
+            "userSnapshots": self.dp["userSnapshotCache"].stats() if "userSnapshotCache" in self.dp.workflow_data else None,
+            "confirmations": self.dp["confirmationService"].stats() if "confirmationService" in self.dp.workflow_data else None,
+        })
+
+    async def _worker(self, idx: int) -> None:
+        while True:
+            payload = await self.queue.get()
+            try:
+                await self.dp.feed_raw_update(self.bot, payload)
+            except Exception as e:
+                logger.error(
+                    f"[WEBHOOK] worker {idx} failed on update {payload.get('update_id')}: {e}",
+                    exc_info=True
+                )
+            finally:
+                self.queue.task_done()
+
+    async def _drainQueue(self) -> None:
+        """let workers finish what was already accepted (telegram considers those delivered)"""
+        if self.queue.qsize():
+            logger.info(f"[WEBHOOK] draining {self.queue.qsize()} queued updates...")
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=settings.WEBHOOK_DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"[WEBHOOK] drain timed out, dropping {self.queue.qsize()} updates")
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            with suppress(asyncio.CancelledError):
+                await worker
+
+    def _installSignalHandlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            # signals are not supported on windows
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, self.stop)
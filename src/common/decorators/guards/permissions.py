@@ -22,7 +22,7 @@ def checkUserNotBanned(handler: Callable) -> Callable:
             userId = event.from_user.id
         
         if not userId: return await handler(*args, **kwargs)
-        user = await userRepo.getByTelegramId(userId)
+        user = await userRepo.getSnapshot(userId)
         fafoTxt = "❌ You are banned from using this bot. FAFO\n\nNow get tf out buddy"
         if user and user.isBanned:
             if isinstance(event, Message):
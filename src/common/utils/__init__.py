@@ -2,3 +2,5 @@ from .db import *
 from .ui import *
 from .telegram import *
 from .messaging import *
+from .metrics import *
+from .cache import *
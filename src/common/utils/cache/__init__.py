@@ -0,0 +1,2 @@
+from .lru import *
+from .two_tier import *
@@ -0,0 +1,42 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    small in-process LRU with optional per-entry TTL (seconds)
+    not thread safe - meant to be used from the event loop only
+    """
+    def __init__(self, maxSize: int, ttl: Optional[float] = None):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        value, expiresAt = entry
+        if expiresAt and expiresAt < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expiresAt = time.monotonic() + self.ttl if self.ttl else 0.0
+        self._data[key] = (value, expiresAt)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxSize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
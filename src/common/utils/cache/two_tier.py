@@ -0,0 +1,166 @@
+import logging
+from typing import Callable, Generic, Hashable, Iterable, Optional, Tuple, TypeVar
+from redis.asyncio import Redis
+from .lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+ValueType = TypeVar("ValueType")
+
+# what invalidate() leaves behind in redis - a miss for get(), and it makes fill() back off
+TOMBSTONE = "~"
+
+class TwoTierCache(Generic[ValueType]):
+    """
+    read-through cache: in-process LRU -> redis ({prefix}:{key}, TTL) -> caller's source of truth
+    shared by the service caches (mapping, user snapshot, nsfw verdict) - they only pass
+    their key prefix, codec and TTLs
+
+    - tuple keys become colon-joined redis keys ((1, 2) -> prefix:1:2)
+    - redis is optional and best-effort: errors are logged and count as a miss / skipped write
+    - the local LRU has its own (usually shorter) TTL - it bounds how long another replica
+      may keep serving an entry this one invalidated
+    - set() is for authoritative values (just committed); fill() is for values read from
+      the source of truth on a miss. invalidate() leaves a tombstone for tombstoneTtl seconds
+      and fill() only writes where there is neither a value nor a tombstone (SET NX), so a
+      read that started before an invalidation can't put the old value back
+    """
+    def __init__(
+        self,
+        name: str,
+        redis: Optional[Redis],
+        prefix: str,
+        encode: Callable[[ValueType], str],
+        decode: Callable[[str], ValueType],
+        ttl: int,
+        localSize: int,
+        localTtl: Optional[float] = None,
+        reportEvery: int = 0,
+        tombstoneTtl: int = 60,
+    ):
+        self.name = name
+        self.redis = redis
+        self.prefix = prefix
+        self.encode = encode
+        self.decode = decode
+        self.ttl = ttl
+        self.local = LRUCache(localSize, ttl=localTtl)
+        self.tombstoneTtl = tombstoneTtl
+        self._tombstones = LRUCache(localSize, ttl=tombstoneTtl)
+        self.reportEvery = reportEvery
+        self.localHits = 0
+        self.redisHits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.skippedFills = 0
+
+    def _getKey(self, key: Hashable) -> str:
+        if isinstance(key, tuple):
+            return f"{self.prefix}:{':'.join(map(str, key))}"
+        return f"{self.prefix}:{key}"
+
+    async def get(self, key: Hashable) -> Optional[ValueType]:
+        value = self.local.get(key)
+        if value is not None:
+            self.localHits += 1
+        else:
+            value = await self._getRemote(key)
+            if value is not None:
+                self.redisHits += 1
+                self.local.set(key, value)
+            else:
+                self.misses += 1
+        self._maybeReport()
+        return value
+
+    async def _getRemote(self, key: Hashable) -> Optional[ValueType]:
+        if not self.redis:
+            return None
+        try:
+            raw = await self.redis.get(self._getKey(key))
+            return self.decode(raw) if raw and raw != TOMBSTONE else None
+        except Exception as e:
+            logger.warning(f"[{self.name}] redis read failed for {key}: {e}")
+            return None
+
+    async def set(self, key: Hashable, value: ValueType) -> None:
+        self._tombstones.pop(key)
+        self.local.set(key, value)
+        if not self.redis:
+            return
+        try:
+            await self.redis.setex(self._getKey(key), self.ttl, self.encode(value))
+        except Exception as e:
+            logger.warning(f"[{self.name}] redis write failed for {key}: {e}")
+
+    async def setMany(self, entries: Iterable[Tuple[Hashable, ValueType]]) -> None:
+        """(key, value) pairs - one pipelined round trip"""
+        entries = list(entries)
+        for key, value in entries:
+            self._tombstones.pop(key)
+            self.local.set(key, value)
+        if not self.redis or not entries:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, value in entries:
+                    pipe.setex(self._getKey(key), self.ttl, self.encode(value))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[{self.name}] redis bulk write failed for {len(entries)} keys: {e}")
+
+    async def fill(self, key: Hashable, value: ValueType) -> None:
+        """cache a value read on a miss - skipped if the key was invalidated (or filled) meanwhile"""
+        if self._tombstones.get(key) is not None:
+            self.skippedFills += 1
+            return
+        if self.redis:
+            try:
+                stored = await self.redis.set(self._getKey(key), self.encode(value), ex=self.ttl, nx=True)
+            except Exception as e:
+                logger.warning(f"[{self.name}] redis fill failed for {key}: {e}")
+                return
+            if not stored:
+                self.skippedFills += 1
+                return
+        if self._tombstones.get(key) is None:
+            self.local.set(key, value)
+
+    async def invalidate(self, keys: Iterable[Hashable]) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+        self.invalidations += len(keys)
+        for key in keys:
+            self.local.pop(key)
+            self._tombstones.set(key, True)
+        if not self.redis:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.setex(self._getKey(key), self.tombstoneTtl, TOMBSTONE)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[{self.name}] redis invalidation failed for {keys}: {e}")
+
+    @property
+    def lookups(self) -> int:
+        return self.localHits + self.redisHits + self.misses
+
+    def stats(self) -> dict:
+        lookups = self.lookups
+        return {
+            "lookups": lookups,
+            "localHits": self.localHits,
+            "redisHits": self.redisHits,
+            "misses": self.misses,
+            "hitRatio": round((self.localHits + self.redisHits) / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "skippedFills": self.skippedFills,
+            "localSize": len(self.local),
+        }
+
+    def _maybeReport(self) -> None:
+        if self.reportEvery and self.lookups % self.reportEvery == 0:
+            logger.info(f"[{self.name}] {self.stats()}")
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, Dict, List, Optional
 import logging
 from db import MessageMappingRepository, MessageMapping
 
@@ -12,14 +12,16 @@ class MappingUtil:
         userChatId: int,
         userMessageId: int,
         channelChatId: int,
-        channelMessageId: int
+        channelMessageId: int,
+        channelMediaGroupId: Optional[str] = None
     ) -> MessageMapping:
         mapping = await repo.createMapping(
             userId=userId,
             userChatId=userChatId,
             userMessageId=userMessageId,
             channelChatId=channelChatId,
-            channelMessageId=channelMessageId
+            channelMessageId=channelMessageId,
+            channelMediaGroupId=channelMediaGroupId
         )
         logger.info(
             f"[MAPPING_CREATE] created mapping: "
@@ -28,6 +30,18 @@ class MappingUtil:
         )
         return mapping
     
+    @staticmethod
+    async def createAndLogBulk(
+        repo: MessageMappingRepository,
+        rows: List[Dict[str, Any]]
+    ) -> List[MessageMapping]:
+        mappings = await repo.createMappingsBulk(rows)
+        logger.info(
+            f"[MAPPING_CREATE] created {len(mappings)} mappings: "
+            + ", ".join(f"{row['userMessageId']} -> {row['channelMessageId']}" for row in rows)
+        )
+        return mappings
+    
     @staticmethod
     async def findReplyMapping(
         repo: MessageMappingRepository,
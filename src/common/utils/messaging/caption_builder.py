@@ -1,5 +1,5 @@
-from typing import Optional
-from aiogram.types import Message
+from typing import List, Optional
+from aiogram.types import Message, MessageEntity
 from .entity_converter import entitiesToHtml
 from ..telegram.link_parser import TelegramLinkParser
 
@@ -14,8 +14,28 @@ class CaptionBuilder:
         """
         build caption from msg w/ opt modifs
         """
-        originalCaption = message.caption if message.caption else ""
-        captionEntities = message.caption_entities
+        return CaptionBuilder.buildCaptionFromParts(
+            message.caption,
+            message.caption_entities,
+            addWarning=addWarning,
+            isReplyLinkToBeRemoved=isReplyLinkToBeRemoved,
+            hasReply=hasReply,
+        )
+
+    @staticmethod
+    def buildCaptionFromParts(
+        text: Optional[str],
+        entities: Optional[List[MessageEntity]] = None,
+        addWarning: bool = False,
+        isReplyLinkToBeRemoved: bool = False,
+        hasReply: bool = False,
+    ) -> tuple[Optional[str], Optional[str]]:
+        """
+        same as buildCaption but from raw caption + entities
+        (e.g. captured in the media group buffer, no Message object around)
+        """
+        originalCaption = text if text else ""
+        captionEntities = entities
 
         if originalCaption and captionEntities:
             formattedCaption = entitiesToHtml(originalCaption, captionEntities)
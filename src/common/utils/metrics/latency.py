@@ -0,0 +1,40 @@
+import logging
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class LatencyTracker:
+    """
+    rolling window of the last maxSamples latencies (ms) with percentile summary
+    reportEvery > 0 -> logs the summary every N samples under [LATENCY :: name]
+    """
+    def __init__(self, name: str, maxSamples: int = 1000, reportEvery: int = 0):
+        self.name = name
+        self.reportEvery = reportEvery
+        self.count = 0
+        self._samples: deque[float] = deque(maxlen=maxSamples)
+
+    def record(self, ms: float) -> None:
+        self._samples.append(ms)
+        self.count += 1
+        if self.reportEvery and self.count % self.reportEvery == 0:
+            logger.info(f"[LATENCY :: {self.name}] {self.summary()}")
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def summary(self) -> dict:
+        if not self._samples:
+            return {"count": self.count}
+        return {
+            "count": self.count,
+            "p50": round(self.percentile(50), 1),
+            "p99": round(self.percentile(99), 1),
+            "max": round(max(self._samples), 1),
+            "avg": round(sum(self._samples) / len(self._samples), 1),
+        }
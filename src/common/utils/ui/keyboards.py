@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
 from config import settings
@@ -36,6 +36,32 @@ def buildMessageActionsKeyboard(
         )
     return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
 
+def buildBatchActionsKeyboard(posts: List[Tuple[int, bool]]) -> Optional[InlineKeyboardMarkup]:
+    """one numbered edit/delete row per (channelMessageId, canEdit) - merged confirmations"""
+    rows = []
+    for idx, (messageId, canEdit) in enumerate(posts, start=1):
+        keyboard = buildMessageActionsKeyboard(messageId, canEdit=canEdit)
+        if keyboard:
+            rows.append([
+                button.model_copy(update={"text": f"{idx}. {button.text}"})
+                for button in keyboard.inline_keyboard[0]
+            ])
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
+def dropPostActions(
+    markup: Optional[InlineKeyboardMarkup],
+    messageId: int
+) -> Optional[InlineKeyboardMarkup]:
+    """remaining rows of a merged confirmation once one of its posts is gone (None if nothing is left)"""
+    if not markup:
+        return None
+    callbacks = (f"edit:{messageId}", f"delete:{messageId}")
+    rows = [
+        row for row in markup.inline_keyboard
+        if not any(button.callback_data in callbacks for button in row)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
 def buildMessageActionsKeyboardFromMessage(
     messageId: int,
     originalMessage: Message
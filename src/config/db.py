@@ -1,25 +1,82 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
     AsyncSession,
     AsyncEngine
 )
-from sqlalchemy.pool import NullPool
-from contextlib import asynccontextmanager
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
+from contextlib import asynccontextmanager, AsyncExitStack
 from typing import AsyncGenerator
 from config.settings import settings
+from db.repositories.base import runAfterCommit
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PoolStats:
+    """
+    connection checkout counters, shared by every pool the engine (re)creates
+    - waitMs covers everything between asking the pool and getting a usable
+      connection back (queue wait + pre-ping + connect for overflow/new conns)
+    """
+    checkouts: int = 0
+    timeouts: int = 0
+    totalWaitMs: float = 0.0
+    maxWaitMs: float = 0.0
+    lastWaitMs: float = 0.0
+
+    def record(self, waitMs: float) -> None:
+        self.checkouts += 1
+        self.totalWaitMs += waitMs
+        self.lastWaitMs = waitMs
+        self.maxWaitMs = max(self.maxWaitMs, waitMs)
+
+    @property
+    def avgWaitMs(self) -> float:
+        return self.totalWaitMs / self.checkouts if self.checkouts else 0.0
+
+poolStats = PoolStats()
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """queue pool that times every checkout into poolStats"""
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            poolStats.timeouts += 1
+            raise
+        poolStats.record((time.perf_counter() - started) * 1000)
+        return connection
 
 class DatabaseManager:
     def __init__(self):
         self._engine: AsyncEngine | None = None
         self._sessionMaker: async_sessionmaker | None = None
+        self._statsTask: asyncio.Task | None = None
     
     def init(self):
+        if settings.DB_USE_POOL:
+            poolKwargs = dict(
+                poolclass=InstrumentedPool,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+                pool_recycle=settings.DB_POOL_RECYCLE,
+            )
+        else:
+            poolKwargs = dict(poolclass=NullPool)
+
         self._engine = create_async_engine(
             settings.DATABASE_URL,
             echo=settings.DB_ECHO,
-            poolclass=NullPool,
             pool_pre_ping=True,
+            **poolKwargs,
         )
         
         self._sessionMaker = async_sessionmaker(
@@ -28,10 +85,63 @@ class DatabaseManager:
             expire_on_commit=False,
         )
     
+    async def warmup(self) -> None:
+        """
+        open pool_size connections up front so the first burst of updates
+        does not pay the tcp + auth handshake; they go back to the pool idle
+        """
+        if not settings.DB_USE_POOL or not settings.DB_POOL_PREWARM:
+            return
+        started = time.perf_counter()
+        async with AsyncExitStack() as stack:
+            await asyncio.gather(*(
+                stack.enter_async_context(self.engine.connect())
+                for _ in range(settings.DB_POOL_SIZE)
+            ))
+        logger.info(
+            f"[DB_POOL] pre-warmed {settings.DB_POOL_SIZE} connections "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    def getPoolStats(self) -> dict:
+        """gauges for the current pool state + checkout wait counters"""
+        pool = self.engine.pool
+        if not isinstance(pool, AsyncAdaptedQueuePool):
+            return {"pooled": False}
+        return {
+            "pooled": True,
+            "size": pool.size(),
+            "inUse": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkouts": poolStats.checkouts,
+            "timeouts": poolStats.timeouts,
+            "avgWaitMs": round(poolStats.avgWaitMs, 2),
+            "maxWaitMs": round(poolStats.maxWaitMs, 2),
+            "lastWaitMs": round(poolStats.lastWaitMs, 2),
+        }
+
+    def startStatsReporter(self) -> None:
+        if settings.DB_USE_POOL and settings.DB_POOL_STATS_INTERVAL_SECONDS > 0:
+            self._statsTask = asyncio.create_task(self._reportStats(), name="db-pool-stats")
+
+    async def _reportStats(self) -> None:
+        while True:
+            await asyncio.sleep(settings.DB_POOL_STATS_INTERVAL_SECONDS)
+            logger.info(f"[DB_POOL] {self.getPoolStats()}")
+
     async def close(self):
+        if self._statsTask:
+            self._statsTask.cancel()
         if self._engine:
             await self._engine.dispose()
     
+    def createSession(self) -> AsyncSession:
+        """bare session - the caller owns commit/rollback/close (see ServiceContainer)"""
+        if not self._sessionMaker:
+            raise RuntimeError("database not initted")
+        return self._sessionMaker()
+
     @asynccontextmanager
     async def session(self) -> AsyncGenerator[AsyncSession, None]:
         if not self._sessionMaker:
@@ -43,7 +153,9 @@ class DatabaseManager:
                 await session.commit()
             except Exception:
                 await session.rollback()
+                await runAfterCommit(session, committed=False)
                 raise
+            await runAfterCommit(session)
     
     @property
     def engine(self) -> AsyncEngine:
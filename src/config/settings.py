@@ -9,21 +9,109 @@ class Settings(BaseSettings):
     
     DATABASE_URL: str
     DB_ECHO: bool = False
+    DB_USE_POOL: bool = True # False -> NullPool (new connection per session)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PREWARM: bool = True
+    DB_POOL_STATS_INTERVAL_SECONDS: int = 0 # 0 -> no periodic pool stats log
     
     REDIS_URL: str
     REDIS_DB: int = 0
     
     RATE_LIMIT_MESSAGES: int = 5
     RATE_LIMIT_WINDOW_SECONDS: int = 60
+    RATE_LIMIT_STRATEGY: str = "sliding_window" # sliding_window | token_bucket
+    RATE_LIMIT_BURST: int = 5 # token bucket capacity
     
+    SUBSCRIPTION_CACHE_TTL_SUBSCRIBED: int = 900
+    SUBSCRIPTION_CACHE_TTL_LEFT: int = 60
+    SUBSCRIPTION_CACHE_TTL_KICKED: int = 300
+
     ENABLE_NSFW_CHECK: bool = True
     ENFORCED_NSFW_CHECK: bool = False
     NSFW_DETECTION_THRESHOLD: float = 0.6
+    NSFW_EXECUTOR: str = "thread" # thread | process
+    NSFW_WORKERS: int = 2
+    NSFW_QUEUE_SIZE: int = 16 # checks allowed to wait for a worker
+    NSFW_QUEUE_TIMEOUT_SECONDS: float = 10
+    NSFW_MAX_INMEMORY_BYTES: int = 8 * 1024 * 1024 # bigger files (videos) go through a temp file
+    NSFW_VIDEO_MAX_FRAMES: int = 8 # evenly spaced keyframes sampled per video
+    NSFW_VIDEO_BATCH_SIZE: int = 4 # frames per inference batch (early stop between batches)
+    NSFW_VIDEO_TIME_BUDGET_SECONDS: float = 5
+    NSFW_VERDICT_CACHE_SIZE: int = 2048 # in-process LRU entries
+    NSFW_VERDICT_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    NSFW_VERDICT_CACHE_REPORT_EVERY: int = 500 # log hit ratio every N lookups, 0 = off
+
+    # -- reply resolution :: (userChatId, userMessageId) -> channel message, LRU -> redis -> postgres
+    MAPPING_CACHE_SIZE: int = 10000
+    MAPPING_CACHE_LOCAL_TTL_SECONDS: float = 60 # bounds staleness of other replicas' LRU after a delete/edit
+    MAPPING_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+
+    # -- users.lastActiveAt :: batched, written at most once per interval per user
+    USER_ACTIVITY_FLUSH_SECONDS: float = 30
+
+    # -- user snapshot (id, isBanned, isAdmin, alias) :: telegramId -> LRU -> redis -> postgres
+    # kept short on purpose: bans/admin flags are set straight in the DB, so a change shows up within
+    # TTL + LOCAL_TTL seconds (DEL user_snapshot:<telegramId> in redis to apply it sooner)
+    USER_SNAPSHOT_CACHE_SIZE: int = 10000
+    USER_SNAPSHOT_LOCAL_TTL_SECONDS: float = 5
+    USER_SNAPSHOT_TTL_SECONDS: int = 30
+
+    # -- album buffering :: flush on full album, idle gap or hard deadline
+    MEDIA_GROUP_MAX_ITEMS: int = 10
+    MEDIA_GROUP_IDLE_FACTOR: float = 3.0 # idle interval = factor x observed gap between items
+    MEDIA_GROUP_IDLE_MIN_MS: int = 400
+    MEDIA_GROUP_IDLE_MAX_MS: int = 1500
+    MEDIA_GROUP_MAX_WAIT_SECONDS: float = 5
+    MEDIA_GROUP_BUFFER_TTL_SECONDS: int = 60
+    MEDIA_GROUP_LEASE_MS: int = 3000 # coordinator lease, renewed while the album is collected
+    MEDIA_GROUP_SWEEP_INTERVAL_SECONDS: float = 2 # orphaned album takeover check
+
+    # -- deferred work (album coordinators etc) :: drained on shutdown
+    BACKGROUND_TASK_LIMIT: int = 200
+    BACKGROUND_DRAIN_TIMEOUT_SECONDS: float = 15
+
+    # -- outbound pacing :: telegram limits ~30 msg/s overall, ~1 msg/s per private chat, 20 msg/min per group/channel
+    OUTBOUND_GLOBAL_RATE: float = 30
+    OUTBOUND_CHAT_RATE: float = 1
+    OUTBOUND_CHAT_BURST: int = 3
+    OUTBOUND_GROUP_RATE_PER_MINUTE: float = 20
+    OUTBOUND_GROUP_BURST: int = 20
+    # edits/deletes are paced per chat apart from sends, so a full post budget doesn't hold them up
+    OUTBOUND_EDIT_RATE: float = 1
+    OUTBOUND_EDIT_BURST: int = 5
+    OUTBOUND_MAX_RETRIES: int = 3
+    OUTBOUND_MAX_RETRY_AFTER_SECONDS: float = 60 # longer flood waits are raised instead of waited out
+    OUTBOUND_MAX_TRACKED_CHATS: int = 10000
+    # a retry-after this long, or from this many chats within the window, is treated as a bot-wide flood wait
+    OUTBOUND_GLOBAL_BLOCK_RETRY_AFTER_SECONDS: float = 10
+    OUTBOUND_GLOBAL_BLOCK_CHATS: int = 2
+    OUTBOUND_GLOBAL_BLOCK_WINDOW_SECONDS: float = 5
+
+    # -- post confirmations :: deferred on the LOW lane, a burst from one chat is merged into one message
+    CONFIRMATION_COALESCE_SECONDS: float = 1.5
+    CONFIRMATION_MAX_BATCH: int = 10
+    CONFIRMATION_STRATEGY_TTL_SECONDS: int = 30 * 24 * 3600 # remembered reply strategy per chat
 
     ENABLE_EDIT: bool = True
     ENABLE_DELETE: bool = True
     
     LOG_LEVEL: str = "INFO"
+
+    # -- update intake :: "polling" (default) or "webhook"
+    BOT_MODE: str = "polling"
+    WEBHOOK_URL: Optional[str] = None # public base url, e.g. https://bot.example.com
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_SET_ON_STARTUP: bool = True
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+    WEBHOOK_QUEUE_SIZE: int = 1000
+    WEBHOOK_WORKERS: int = 16
+    WEBHOOK_DRAIN_TIMEOUT_SECONDS: int = 10
     
     model_config = SettingsConfigDict(
         env_file='../.env',
@@ -1,9 +1,38 @@
-from sqlalchemy import BigInteger, Boolean, ForeignKey
+from typing import Optional
+from sqlalchemy import BigInteger, Boolean, ForeignKey, Index, String, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from db.models.base import Base, IdMixin, TimestampMixin
 
 class MessageMapping(Base, IdMixin, TimestampMixin):
     __tablename__ = "message_mappings"
+    __table_args__ = (
+        # live-row lookups - one per repository query shape
+        Index(
+            "ix_message_mappings_user_message_active",
+            "userChatId",
+            "userMessageId",
+            postgresql_where=text('"isDeleted" = false'),
+        ),
+        Index(
+            "ix_message_mappings_user_last_edit_active",
+            "userChatId",
+            "userLastEditMessageId",
+            postgresql_where=text('"isDeleted" = false AND "userLastEditMessageId" IS NOT NULL'),
+        ),
+        Index(
+            "ix_message_mappings_channel_message_active",
+            "channelChatId",
+            "channelMessageId",
+            postgresql_where=text('"isDeleted" = false'),
+        ),
+        # album sibling lookup - only album rows are indexed
+        Index(
+            "ix_message_mappings_channel_media_group",
+            "channelChatId",
+            "channelMediaGroupId",
+            postgresql_where=text('"channelMediaGroupId" IS NOT NULL'),
+        ),
+    )
     
     userId: Mapped[int] = mapped_column(
         BigInteger,
@@ -40,6 +69,12 @@ class MessageMapping(Base, IdMixin, TimestampMixin):
         index=True
     )
     
+    # telegram media_group_id of the channel album this post belongs to (None for single posts)
+    channelMediaGroupId: Mapped[Optional[str]] = mapped_column(
+        String(64),
+        nullable=True
+    )
+    
     isDeleted: Mapped[bool] = mapped_column(
         Boolean,
         default=False,
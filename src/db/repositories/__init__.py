@@ -1,13 +1,16 @@
-from db.repositories.base import BaseRepository
-from db.repositories.user import UserRepository
-from db.repositories.message_mapping import MessageMappingRepository
+from db.repositories.base import BaseRepository, runAfterCommit
+from db.repositories.user import UserRepository, UserSnapshot
+from db.repositories.message_mapping import MessageMappingRepository, ChannelMessageRef
 from db.repositories.comment_mapping import CommentMappingRepository
 from db.repositories.channel_thread_mapping import ChannelThreadMappingRepository
 
 __all__ = [
     "BaseRepository",
+    "runAfterCommit",
     "UserRepository",
+    "UserSnapshot",
     "MessageMappingRepository",
+    "ChannelMessageRef",
     "CommentMappingRepository",
     "ChannelThreadMappingRepository",
 ]
@@ -1,20 +1,53 @@
-from typing import TypeVar, Generic, Type, Optional, List
+import logging
+from typing import Awaitable, Callable, TypeVar, Generic, Type, Optional, List
 from sqlalchemy import select, update, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models.base import Base
 
+logger = logging.getLogger(__name__)
+
 ModelType = TypeVar("ModelType", bound=Base)
 
+AFTER_COMMIT_KEY = "afterCommit"
+
+async def runAfterCommit(session: AsyncSession, committed: bool = True) -> None:
+    """
+    run (committed) or drop (rolled back) what repositories queued with afterCommit -
+    called by whoever owns the session right after commit/rollback
+    """
+    callbacks = session.info.pop(AFTER_COMMIT_KEY, [])
+    if not committed:
+        return
+    for callback in callbacks:
+        try:
+            await callback()
+        except Exception as e:
+            logger.warning(f"[AFTER_COMMIT] callback failed: {e}")
+
 class BaseRepository(Generic[ModelType]):
     def __init__(self, model: Type[ModelType], session: AsyncSession):
         self.model = model
         self.session = session
+
+    def afterCommit(self, callback: Callable[[], Awaitable[None]]) -> None:
+        """
+        defer a side effect (cache fill/invalidation) until the transaction is committed -
+        nothing is cached that may still roll back, and a concurrent reader can't re-cache
+        the old row between our invalidation and the commit
+        """
+        self.session.info.setdefault(AFTER_COMMIT_KEY, []).append(callback)
     
-    async def create(self, **kwargs) -> ModelType:
+    async def create(self, refresh: bool = False, **kwargs) -> ModelType:
+        """
+        INSERT via flush - id and server defaults (createdAt/updatedAt) already come back
+        through RETURNING on postgres; refresh=True re-SELECTs the row (trigger-set columns,
+        backends without RETURNING)
+        """
         instance = self.model(**kwargs)
         self.session.add(instance)
         await self.session.flush()
-        await self.session.refresh(instance)
+        if refresh:
+            await self.session.refresh(instance)
         return instance
     
     async def getById(self, id: int) -> Optional[ModelType]:
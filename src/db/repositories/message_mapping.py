@@ -1,8 +1,9 @@
 import logging
-from typing import Optional
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, TYPE_CHECKING
 from sqlalchemy import (
-    or_,
     and_,
+    insert,
+    union,
     update,
     select, 
 )
@@ -11,11 +12,25 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from db.models.message_mapping import MessageMapping
 from db.repositories.base import BaseRepository
 
+if TYPE_CHECKING:
+    from services.mapping_cache import MappingCache
+
 logger = logging.getLogger(__name__)
 
+class ChannelMessageRef(NamedTuple):
+    """where a user message ended up in the channel - all reply resolution needs"""
+    channelChatId: int
+    channelMessageId: int
+
 class MessageMappingRepository(BaseRepository[MessageMapping]):
-    def __init__(self, session: AsyncSession):
+    """
+    cache (optional, MappingCache singleton): resolveChannelMessage reads through it;
+    createMapping* fill it, markAsDeleted*/updateLastEditMessageId drop the affected keys -
+    both only after the transaction commits (see BaseRepository.afterCommit)
+    """
+    def __init__(self, session: AsyncSession, cache: Optional["MappingCache"] = None):
         super().__init__(MessageMapping, session)
+        self.cache = cache
     
     async def getByUserMessage(
         self,
@@ -56,17 +71,19 @@ class MessageMappingRepository(BaseRepository[MessageMapping]):
         userChatId: int,
         userMessageId: int
     ) -> Optional[MessageMapping]:
+        # UNION of two index seeks instead of an OR the planner can only answer with a bitmap/seq scan
+        byOriginal = select(MessageMapping).where(
+            MessageMapping.userChatId == userChatId,
+            MessageMapping.userMessageId == userMessageId,
+            MessageMapping.isDeleted == False
+        )
+        byLastEdit = select(MessageMapping).where(
+            MessageMapping.userChatId == userChatId,
+            MessageMapping.userLastEditMessageId == userMessageId,
+            MessageMapping.isDeleted == False
+        )
         result = await self.session.execute(
-            select(MessageMapping).where(
-                and_(
-                    MessageMapping.userChatId == userChatId,
-                    MessageMapping.isDeleted == False,
-                    or_(
-                        MessageMapping.userMessageId == userMessageId,
-                        MessageMapping.userLastEditMessageId == userMessageId
-                    )
-                )
-            )
+            select(MessageMapping).from_statement(union(byOriginal, byLastEdit))
         )
         mapping = result.scalar_one_or_none()
         logger.info(f"[GET_MAPPING] found: {mapping is not None}")
@@ -84,17 +101,76 @@ class MessageMappingRepository(BaseRepository[MessageMapping]):
         userChatId: int,
         userMessageId: int,
         channelChatId: int,
-        channelMessageId: int
+        channelMessageId: int,
+        channelMediaGroupId: Optional[str] = None
     ) -> MessageMapping:
         mapping = await self.create(
             userId=userId,
             userChatId=userChatId,
             userMessageId=userMessageId,
             channelChatId=channelChatId,
-            channelMessageId=channelMessageId
+            channelMessageId=channelMessageId,
+            channelMediaGroupId=channelMediaGroupId
         )
-        await self.session.flush()
+        if self.cache:
+            ref = ChannelMessageRef(channelChatId, channelMessageId)
+            self.afterCommit(lambda: self.cache.set(userChatId, userMessageId, ref))
         return mapping
+
+    async def createMappingsBulk(self, rows: List[Dict[str, Any]]) -> List[MessageMapping]:
+        """
+        whole album in one multi-row INSERT ... RETURNING
+        rows = createMapping kwargs (userId, userChatId, userMessageId, channelChatId, channelMessageId, channelMediaGroupId)
+        """
+        if not rows:
+            return []
+        result = await self.session.scalars(
+            insert(MessageMapping).values(rows).returning(MessageMapping)
+        )
+        mappings = list(result.all())
+        if self.cache:
+            entries = [
+                ((mapping.userChatId, mapping.userMessageId), ChannelMessageRef(mapping.channelChatId, mapping.channelMessageId))
+                for mapping in mappings
+            ]
+            self.afterCommit(lambda: self.cache.setMany(entries))
+        return mappings
+
+    async def resolveChannelMessage(self, userChatId: int, userMessageId: int) -> Optional[ChannelMessageRef]:
+        """channel message for a user message (or its latest edit) - cache first, then the DB"""
+        if self.cache:
+            ref = await self.cache.get(userChatId, userMessageId)
+            if ref:
+                return ref
+        mapping = await self.getByUserMessageOrLastEditMessage(userChatId, userMessageId)
+        if not mapping:
+            return None
+        ref = ChannelMessageRef(mapping.channelChatId, mapping.channelMessageId)
+        if self.cache:
+            # fill, not set: a delete/edit invalidated since our read must win
+            await self.cache.fill(userChatId, userMessageId, ref)
+        return ref
+    
+    async def getAlbumMessageIds(self, channelChatId: int, channelMessageId: int) -> List[int]:
+        """every channel message of the album this post belongs to, in order; [] for single posts"""
+        mediaGroupId = (
+            select(MessageMapping.channelMediaGroupId)
+            .where(
+                MessageMapping.channelChatId == channelChatId,
+                MessageMapping.channelMessageId == channelMessageId
+            )
+            .limit(1)
+            .scalar_subquery()
+        )
+        result = await self.session.execute(
+            select(MessageMapping.channelMessageId)
+            .where(
+                MessageMapping.channelChatId == channelChatId,
+                MessageMapping.channelMediaGroupId == mediaGroupId
+            )
+            .order_by(MessageMapping.channelMessageId)
+        )
+        return list(result.scalars().all())
     
     async def markAsDeleted(
         self,
@@ -114,19 +190,69 @@ class MessageMappingRepository(BaseRepository[MessageMapping]):
             return False
         mapping.isDeleted = True
         await self.session.flush()
+        if self.cache:
+            keys = [
+                (mapping.userChatId, mapping.userMessageId),
+                (mapping.userChatId, mapping.userLastEditMessageId),
+            ]
+            self.afterCommit(lambda: self.cache.invalidate(keys))
         return True
     
+    async def markAsDeletedBulk(
+        self,
+        channelChatId: int,
+        channelMessageIds: Iterable[int]
+    ) -> int:
+        """single UPDATE for a whole album; returns the number of rows marked"""
+        channelMessageIds = list(channelMessageIds)
+        if not channelMessageIds:
+            return 0
+        result = await self.session.execute(
+            update(MessageMapping)
+            .where(
+                MessageMapping.channelChatId == channelChatId,
+                MessageMapping.channelMessageId.in_(channelMessageIds)
+            )
+            .values(isDeleted=True)
+            .returning(
+                MessageMapping.userChatId,
+                MessageMapping.userMessageId,
+                MessageMapping.userLastEditMessageId
+            )
+        )
+        rows = result.all()
+        if self.cache:
+            keys = [
+                key for row in rows
+                for key in ((row.userChatId, row.userMessageId), (row.userChatId, row.userLastEditMessageId))
+            ]
+            self.afterCommit(lambda: self.cache.invalidate(keys))
+        return len(rows)
+
     async def updateLastEditMessageId(
         self,
         userMessageId: int,
         userChatId: int,
         lastEditMessageId: int
     ) -> None:
-        await self.session.execute(
-            update(MessageMapping)
+        # the previous edit id stops resolving - read it in the same statement to drop its cache entry
+        previous = (
+            select(
+                MessageMapping.id,
+                MessageMapping.userLastEditMessageId.label("previousEditId")
+            )
             .where(
                 MessageMapping.userMessageId == userMessageId,
                 MessageMapping.userChatId == userChatId
             )
+            .subquery()
+        )
+        result = await self.session.execute(
+            update(MessageMapping)
+            .where(MessageMapping.id == previous.c.id)
             .values(userLastEditMessageId=lastEditMessageId)
+            .returning(previous.c.previousEditId)
         )
+        if self.cache:
+            keys = [(userChatId, row.previousEditId) for row in result.all()]
+            self.afterCommit(lambda: self.cache.invalidate(keys))
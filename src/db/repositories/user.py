@@ -1,13 +1,58 @@
-from typing import Optional
+import zlib
+from typing import NamedTuple, Optional, TYPE_CHECKING
 from datetime import datetime
-from sqlalchemy import select, func
+from sqlalchemy import BigInteger, String, select, func, literal, exists, or_, union_all
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models.user import User
 from db.repositories.base import BaseRepository
 
+if TYPE_CHECKING:
+    from services.user_activity import UserActivityTracker
+    from services.user_snapshot_cache import UserSnapshotCache
+
+def profileChecksum(username: Optional[str], firstName: str, lastName: Optional[str]) -> int:
+    return zlib.crc32(f"{username or ''}\x00{firstName}\x00{lastName or ''}".encode())
+
+class UserSnapshot(NamedTuple):
+    """
+    immutable hot-path view of a user - all that ban/admin/alias checks and posting need
+    profileCrc lets ensureUser skip the upsert while username/name are unchanged
+    """
+    id: int
+    telegramId: int
+    isBanned: bool
+    isAdmin: bool
+    alias: Optional[str]
+    profileCrc: int
+
+    @classmethod
+    def fromUser(cls, user: User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            telegramId=user.telegramId,
+            isBanned=user.isBanned,
+            isAdmin=user.isAdmin,
+            alias=user.alias,
+            profileCrc=profileChecksum(user.username, user.firstName, user.lastName),
+        )
+
 class UserRepository(BaseRepository[User]):    
-    def __init__(self, session: AsyncSession):
+    """
+    activityTracker (optional, singleton): getOrCreate hands lastActiveAt to it instead
+    of updating the row on every message
+    snapshotCache (optional, singleton): getSnapshot/ensureUser read through it;
+    ban/unban/setAlias/clearAlias invalidate the user's entry once the transaction commits
+    """
+    def __init__(
+        self,
+        session: AsyncSession,
+        activityTracker: Optional["UserActivityTracker"] = None,
+        snapshotCache: Optional["UserSnapshotCache"] = None
+    ):
         super().__init__(User, session)
+        self.activityTracker = activityTracker
+        self.snapshotCache = snapshotCache
     
     async def getByTelegramId(self, telegramId: int) -> Optional[User]:
         result = await self.session.execute(
@@ -15,6 +60,45 @@ class UserRepository(BaseRepository[User]):
         )
         return result.scalar_one_or_none()
     
+    async def getSnapshot(self, telegramId: int) -> Optional[UserSnapshot]:
+        if self.snapshotCache:
+            snapshot = await self.snapshotCache.get(telegramId)
+            if snapshot:
+                return snapshot
+        user = await self.getByTelegramId(telegramId)
+        if not user:
+            return None
+        # a plain read of the committed row - cached right away so the handler's own lookup hits
+        snapshot = UserSnapshot.fromUser(user)
+        if self.snapshotCache:
+            await self.snapshotCache.fill(snapshot)
+        return snapshot
+
+    async def ensureUser(
+        self,
+        telegramId: int,
+        username: Optional[str] = None,
+        firstName: str = "",
+        lastName: Optional[str] = None
+    ) -> UserSnapshot:
+        """getOrCreate for the hot path - no DB round trip while the cached profile still matches"""
+        if self.snapshotCache:
+            snapshot = await self.snapshotCache.get(telegramId)
+            if snapshot and snapshot.profileCrc == profileChecksum(username, firstName, lastName):
+                if self.activityTracker:
+                    self.activityTracker.touch(snapshot.id)
+                return snapshot
+        user = await self.getOrCreate(telegramId, username, firstName, lastName)
+        snapshot = UserSnapshot.fromUser(user)
+        if self.snapshotCache:
+            # the row may have just been inserted/updated - don't cache it unless that commits
+            self.afterCommit(lambda: self.snapshotCache.set(snapshot))
+        return snapshot
+
+    def _invalidateSnapshot(self, telegramId: int) -> None:
+        if self.snapshotCache:
+            self.afterCommit(lambda: self.snapshotCache.invalidate(telegramId))
+    
     async def getOrCreate(
         self,
         telegramId: int,
@@ -22,24 +106,59 @@ class UserRepository(BaseRepository[User]):
         firstName: str = "",
         lastName: Optional[str] = None
     ) -> User:
-        user = await self.getByTelegramId(telegramId)
-        if user:
+        """
+        one round trip that only writes when it has to:
+        - known user, same profile -> plain read (no insert attempt, no row lock, no sequence bump)
+        - profile changed          -> INSERT .. ON CONFLICT DO UPDATE of the changed fields
+        - new user                 -> INSERT
+        """
+        users = User.__table__
+        existing = select(users).where(users.c.telegramId == telegramId).cte("existing")
+        unchanged = select(existing.c.id).where(
+            existing.c.username.is_not_distinct_from(username),
+            existing.c.firstName == firstName,
+            existing.c.lastName.is_not_distinct_from(lastName),
+        )
+        source = select(
+            literal(telegramId, BigInteger),
+            literal(username, String),
+            literal(firstName, String),
+            literal(lastName, String),
+        ).where(~exists(unchanged))
+        stmt = insert(User).from_select(["telegramId", "username", "firstName", "lastName"], source)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[users.c.telegramId],
+            set_={
+                "username": stmt.excluded.username,
+                "firstName": stmt.excluded.firstName,
+                "lastName": stmt.excluded.lastName,
+                "updatedAt": func.now(),
+            },
+            where=or_(
+                users.c.username.is_distinct_from(stmt.excluded.username),
+                users.c.firstName.is_distinct_from(stmt.excluded.firstName),
+                users.c.lastName.is_distinct_from(stmt.excluded.lastName),
+            )
+        )
+        upserted = stmt.returning(*users.c).cte("upserted")
+        result = await self.session.execute(
+            select(User)
+            .from_statement(union_all(
+                select(upserted),
+                select(existing).where(~exists(select(upserted.c.id)))
+            ))
+            .execution_options(populate_existing=True)
+        )
+        user = result.scalar_one_or_none()
+        if user is None:
+            # lost an insert race - the row committed after this statement's snapshot
+            user = await self.getByTelegramId(telegramId)
+        if self.activityTracker:
+            self.activityTracker.touch(user.id)
+        else:
             user.lastActiveAt = datetime.now()
-            if username != user.username:
-                user.username = username
-            if firstName != user.firstName:
-                user.firstName = firstName
-            if lastName != user.lastName:
-                user.lastName = lastName
             await self.session.flush()
-            return user
-        
-        return await self.create(
-            telegramId=telegramId,
-            username=username,
-            firstName=firstName,
-            lastName=lastName
-        )
+        return user
     
     async def banUserByTelegramId(self, telegramId: int) -> bool:
         result = await self.session.execute(
@@ -50,6 +169,7 @@ class UserRepository(BaseRepository[User]):
             return False
         user.isBanned = True
         await self.session.flush()
+        self._invalidateSnapshot(telegramId)
         return True
     
     async def unbanUserByTelegramId(self, telegramId: int) -> bool:
@@ -61,6 +181,7 @@ class UserRepository(BaseRepository[User]):
             return False
         user.isBanned = False
         await self.session.flush()
+        self._invalidateSnapshot(telegramId)
         return True
 
     async def getByAlias(self, alias: str) -> Optional[User]:
@@ -85,6 +206,7 @@ class UserRepository(BaseRepository[User]):
             return False
         user.alias = alias
         await self.session.flush()
+        self._invalidateSnapshot(user.telegramId)
         return True
 
     async def clearAlias(self, userId: int) -> None:
@@ -95,4 +217,5 @@ class UserRepository(BaseRepository[User]):
         if user and user.alias:
             user.alias = None
             await self.session.flush()
+            self._invalidateSnapshot(user.telegramId)
     
\ No newline at end of file
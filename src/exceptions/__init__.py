@@ -30,6 +30,10 @@ from exceptions.alias import (
     AliasValidationError,
     AliasTakenError,
 )
+from exceptions.moderation import (
+    ModerationError,
+    DetectionQueueFullError,
+)
 
 __all__ = [
     # base
@@ -58,4 +62,7 @@ __all__ = [
     "AliasError",
     "AliasValidationError",
     "AliasTakenError",
+    # moderation
+    "ModerationError",
+    "DetectionQueueFullError",
 ]
@@ -0,0 +1,12 @@
+from exceptions.base import BotException
+
+class ModerationError(BotException):
+    pass
+
+class DetectionQueueFullError(ModerationError):
+    def __init__(self, queueSize: int):
+        self.queueSize = queueSize
+        super().__init__(
+            f"nsfw detection queue full ({queueSize} pending)",
+            "Media check is busy right now. Please try again in a moment"
+        )
@@ -10,14 +10,24 @@ from bot import (
     private,
     callback,
     ErrorHandlerMiddleware,
-    SessionMiddleware
+    SessionMiddleware,
+    WebhookServer,
 )
 from bot.handlers.settings import router as settingsRouter
 from bot.handlers.group import router as groupRouter
+from bot.handlers.membership import router as membershipRouter
 from services import (
-    RateLimiterService,
     NSFWChecker,
+    NSFWVerdictCache,
+    MediaGroupCoordinator,
+    BackgroundTaskSupervisor,
+    MappingCache,
+    UserActivityTracker,
+    UserSnapshotCache,
+    SubscriptionCheckerService,
+    createRateLimiter,
 )
+from services.messaging import OutboundScheduler, ConfirmationService
 
 logging.basicConfig(
     level=getattr(logging, settings.LOG_LEVEL.upper()),
@@ -42,23 +52,53 @@ async def createTables():
     logger.info(f"{sep} db tables created {sep}")
 
 async def main():
+    nsfwChecker: NSFWChecker | None = None
+    mediaGroupCoordinator: MediaGroupCoordinator | None = None
+    outboundScheduler: OutboundScheduler | None = None
+    taskSupervisor = BackgroundTaskSupervisor(settings.BACKGROUND_TASK_LIMIT)
+    activityTracker = UserActivityTracker()
+    confirmationService: ConfirmationService | None = None
     try:
         logger.info(f"{sep} DB INIT {sep}")
         dbManager.init()
         await createTables()
+        await dbManager.warmup()
+        dbManager.startStatsReporter()
         logger.info(f"{sep} REDIS INIT {sep}")
         await redisManager.init()
         bot = Bot(
             token=settings.BOT_TOKEN,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
+        outboundScheduler = OutboundScheduler()
+        bot.session.middleware(outboundScheduler)
         dp = Dispatcher()
+        # built up front so a webhook misconfiguration (no secret) fails before anything else starts
+        webhookServer = WebhookServer(bot, dp) if settings.BOT_MODE == "webhook" else None
+        dp["outboundScheduler"] = outboundScheduler
         await setCommands(bot)
 
         # -- singletons :: created once - live on dp - available to all handlers
-        dp["nsfwChecker"] = NSFWChecker()
-        dp["rateLimiter"] = RateLimiterService(redisManager.client)
+        nsfwChecker = NSFWChecker(verdictCache=NSFWVerdictCache(redisManager.client))
+        dp["nsfwChecker"] = nsfwChecker
+        dp["rateLimiter"] = createRateLimiter(redisManager.client)
         dp["redis"] = redisManager.client
+        mappingCache = MappingCache(redisManager.client)
+        dp["mappingCache"] = mappingCache
+        activityTracker.start()
+        dp["activityTracker"] = activityTracker
+        dp["userSnapshotCache"] = UserSnapshotCache(redisManager.client)
+        dp["subscriptionChecker"] = SubscriptionCheckerService(
+            bot, settings.CHANNEL_ID, redisManager.client
+        )
+        dp["taskSupervisor"] = taskSupervisor
+        confirmationService = ConfirmationService(bot, redisManager.client, taskSupervisor)
+        dp["confirmationService"] = confirmationService
+        mediaGroupCoordinator = MediaGroupCoordinator(
+            bot, redisManager.client, nsfwChecker, taskSupervisor, confirmationService, mappingCache
+        )
+        mediaGroupCoordinator.start()
+        dp["mediaGroupCoordinator"] = mediaGroupCoordinator
 
         # -- per-request SessionMiddleware opens a DB session and builds
         # session scoped services each update reading singletons from dp
@@ -68,17 +108,35 @@ async def main():
         dp.message.middleware(ErrorHandlerMiddleware())
         dp.callback_query.middleware(ErrorHandlerMiddleware())
 
+        dp.include_router(membershipRouter)
         dp.include_router(settingsRouter)
         dp.include_router(groupRouter)
         dp.include_router(private.router)
         dp.include_router(callback.router)
-        logger.info(f"{sep} BOT STARTED {sep}")
-        await dp.start_polling(bot)
+        if webhookServer:
+            logger.info(f"{sep} BOT STARTED (webhook) {sep}")
+            await webhookServer.run()
+        else:
+            # polling fails with a conflict while a webhook is still registered
+            await bot.delete_webhook(drop_pending_updates=False)
+            logger.info(f"{sep} BOT STARTED (polling) {sep}")
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"OH SHIT WE FUCKED: {e}", exc_info=True)
         raise
     finally:
         logger.info("shutting down...")
+        # no new takeovers, then let pending albums finish while DB/redis are still up
+        if mediaGroupCoordinator:
+            await mediaGroupCoordinator.close()
+        if confirmationService:
+            confirmationService.flush()
+        await taskSupervisor.drain(settings.BACKGROUND_DRAIN_TIMEOUT_SECONDS)
+        if nsfwChecker:
+            await nsfwChecker.close()
+        if outboundScheduler:
+            await outboundScheduler.close()
+        await activityTracker.close()
         await dbManager.close()
         await redisManager.close()
 
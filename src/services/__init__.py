@@ -6,3 +6,8 @@ from .moderation import *
 from .media import *
 from .subscription_checker import *
 from .anon_comment import *
+from .background_tasks import *
+from .mapping_cache import *
+from .user_activity import *
+from .user_snapshot_cache import *
+from .container import *
@@ -61,7 +61,7 @@ class AnonCommentService:
 
         link, commentText, hasNativeReply = parsedArgs
 
-        user = await self.userRepo.getOrCreate(
+        user = await self.userRepo.ensureUser(
             telegramId=message.from_user.id,
             username=message.from_user.username,
             firstName=message.from_user.first_name or "",
@@ -112,6 +112,8 @@ class AnonCommentService:
                 replyParams=replyParams,
                 overrideCaption=commentText if commentText is not None else ("" if message.caption else None),
                 replyMarkup=keyboard,
+                # in-group /anon deletes the source first, so a copy could only fail
+                allowCopy=False,
             )
 
             await self.commentMappingRepo.create(
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Coroutine, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class BackgroundTaskSupervisor:
+    """
+    owner of all deferred/fire-and-forget work (singleton on dp)
+    - keeps a strong reference to every task (the loop alone only holds weak ones)
+    - at most maxConcurrent run at once, the rest wait for a slot
+    - failures are logged with traceback instead of "Task exception was never retrieved"
+    - drain() on shutdown: stop accepting new work, wait for in-flight work up to a deadline,
+      cancel the rest. follow-up work spawned by an in-flight task (an album's confirmation)
+      is still accepted and waited for - it belongs to work we already took on
+    """
+    def __init__(self, maxConcurrent: int):
+        self.maxConcurrent = maxConcurrent
+        self._slots = asyncio.Semaphore(maxConcurrent)
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+        self.failed = 0
+
+    @property
+    def active(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine, name: str) -> Optional[asyncio.Task]:
+        if self._closing and asyncio.current_task() not in self._tasks:
+            logger.warning(f"[BG_TASKS] shutting down - refusing task {name}")
+            coro.close()
+            return None
+        task = asyncio.create_task(self._runLimited(coro, name), name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._onDone)
+        return task
+
+    async def _runLimited(self, coro: Coroutine, name: str) -> None:
+        async with self._slots:
+            try:
+                await coro
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"[BG_TASKS] task {name} failed: {e}", exc_info=True)
+
+    def _onDone(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+
+    def stats(self) -> dict:
+        return {"active": self.active, "limit": self.maxConcurrent, "failed": self.failed}
+
+    async def drain(self, timeout: float) -> None:
+        self._closing = True
+        if not self._tasks:
+            return
+        logger.info(f"[BG_TASKS] draining {len(self._tasks)} background tasks (timeout {timeout}s)...")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        finished = 0
+        # in-flight tasks may still spawn follow-ups, so wait until the set stays empty
+        while self._tasks and loop.time() < deadline:
+            done, _ = await asyncio.wait(set(self._tasks), timeout=deadline - loop.time())
+            finished += len(done)
+        pending = set(self._tasks)
+        if pending:
+            names = ", ".join(sorted(task.get_name() for task in pending))
+            logger.warning(f"[BG_TASKS] drain timed out - cancelling {len(pending)} tasks: {names}")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        logger.info(f"[BG_TASKS] drained ({finished} finished, {len(pending)} cancelled)")
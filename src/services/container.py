@@ -0,0 +1,159 @@
+from functools import cached_property
+from typing import Any, Dict, Iterable
+from aiogram import Bot
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import dbManager
+from db import (
+    UserRepository,
+    MessageMappingRepository,
+    CommentMappingRepository,
+    ChannelThreadMappingRepository,
+    runAfterCommit
+)
+from services.message_forwarder import MessageForwarderService
+from services.media import MediaGroupHandler, MediaGroupCoordinator
+from services.reply_resolver import ReplyResolverService
+from services.edit_service import EditService
+from services.anon_comment import AnonCommentService
+from services.rate_limiting import RateLimiterService
+from services.moderation import NSFWChecker
+from services.subscription_checker import SubscriptionCheckerService
+from services.messaging import ConfirmationService
+from services.mapping_cache import MappingCache
+from services.user_activity import UserActivityTracker
+from services.user_snapshot_cache import UserSnapshotCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """
+    lazy per-update dependency container
+
+    every repo/service is a cached_property - built on first access only,
+    and the DB session itself is only created once something asks for it
+    (/start never opens one)
+
+    singletons (bot, redis, rateLimiter, nsfwChecker, subscriptionChecker, mediaGroupCoordinator,
+    confirmationService, mappingCache, activityTracker, userSnapshotCache) are passed in from dp
+    """
+    PROVIDED = frozenset({
+        "session",
+        "userRepo",
+        "messageMappingRepo",
+        "commentMappingRepo",
+        "channelThreadRepo",
+        "replyResolver",
+        "editService",
+        "messageForwarder",
+        "mediaGroupHandler",
+        "anonCommentService",
+    })
+
+    def __init__(
+        self,
+        bot: Bot,
+        redis: Redis,
+        rateLimiter: RateLimiterService,
+        nsfwChecker: NSFWChecker,
+        subscriptionChecker: SubscriptionCheckerService,
+        mediaGroupCoordinator: MediaGroupCoordinator,
+        confirmationService: ConfirmationService,
+        mappingCache: MappingCache,
+        activityTracker: UserActivityTracker,
+        userSnapshotCache: UserSnapshotCache,
+    ):
+        self.bot = bot
+        self.redis = redis
+        self.rateLimiter = rateLimiter
+        self.nsfwChecker = nsfwChecker
+        self.subscriptionChecker = subscriptionChecker
+        self.mediaGroupCoordinator = mediaGroupCoordinator
+        self.confirmationService = confirmationService
+        self.mappingCache = mappingCache
+        self.activityTracker = activityTracker
+        self.userSnapshotCache = userSnapshotCache
+
+    @cached_property
+    def session(self) -> AsyncSession:
+        return dbManager.createSession()
+
+    @cached_property
+    def userRepo(self) -> UserRepository:
+        return UserRepository(self.session, self.activityTracker, self.userSnapshotCache)
+
+    @cached_property
+    def messageMappingRepo(self) -> MessageMappingRepository:
+        return MessageMappingRepository(self.session, self.mappingCache)
+
+    @cached_property
+    def commentMappingRepo(self) -> CommentMappingRepository:
+        return CommentMappingRepository(self.session)
+
+    @cached_property
+    def channelThreadRepo(self) -> ChannelThreadMappingRepository:
+        return ChannelThreadMappingRepository(self.session)
+
+    @cached_property
+    def replyResolver(self) -> ReplyResolverService:
+        return ReplyResolverService(self.bot, self.messageMappingRepo)
+
+    @cached_property
+    def editService(self) -> EditService:
+        return EditService(self.bot, self.redis, self.messageMappingRepo)
+
+    @cached_property
+    def messageForwarder(self) -> MessageForwarderService:
+        return MessageForwarderService(
+            self.bot,
+            self.userRepo,
+            self.messageMappingRepo,
+            self.replyResolver,
+            self.rateLimiter,
+            self.nsfwChecker,
+            self.redis,
+            self.subscriptionChecker,
+            self.mediaGroupCoordinator,
+            self.confirmationService
+        )
+
+    @cached_property
+    def mediaGroupHandler(self) -> MediaGroupHandler:
+        return self.messageForwarder.mediaGroupHandler
+
+    @cached_property
+    def anonCommentService(self) -> AnonCommentService:
+        return AnonCommentService(
+            self.bot,
+            self.userRepo,
+            self.commentMappingRepo,
+            self.channelThreadRepo,
+        )
+
+    @property
+    def hasSession(self) -> bool:
+        return "session" in self.__dict__
+
+    def inject(self, data: Dict[str, Any], names: Iterable[str]) -> None:
+        """resolve only the requested names into handler data"""
+        for name in names:
+            if name in self.PROVIDED:
+                data[name] = getattr(self, name)
+
+    async def close(self, failed: bool = False) -> None:
+        """commit only when the session actually ran something; rollback on error"""
+        if not self.hasSession:
+            return
+        session = self.session
+        committed = False
+        try:
+            if failed:
+                await session.rollback()
+            elif session.in_transaction():
+                await session.commit()
+            committed = not failed
+        finally:
+            await session.close()
+            # queued cache writes/invalidations only once the rows are committed
+            await runAfterCommit(session, committed=committed)
@@ -0,0 +1,49 @@
+from typing import Iterable, Optional, Tuple
+from redis.asyncio import Redis
+from config import settings
+from common import TwoTierCache
+from db import ChannelMessageRef
+
+def _encodeRef(ref: ChannelMessageRef) -> str:
+    return f"{ref.channelChatId}:{ref.channelMessageId}"
+
+def _decodeRef(raw: str) -> ChannelMessageRef:
+    channelChatId, channelMessageId = raw.split(":")
+    return ChannelMessageRef(int(channelChatId), int(channelMessageId))
+
+class MappingCache:
+    """
+    (userChatId, userMessageId) -> ChannelMessageRef for reply resolution (singleton on dp)
+    in-process LRU -> redis (mapping:{userChatId}:{userMessageId}) -> DB
+
+    MessageMappingRepository reads through it, sets it on createMapping, fills it on DB hits
+    (guarded - see TwoTierCache.fill) and drops entries on delete / new edit. mappings are otherwise immutable, so the
+    only staleness is another replica's LRU - it ages out after MAPPING_CACHE_LOCAL_TTL_SECONDS
+    """
+    def __init__(self, redis: Optional[Redis] = None):
+        self.cache = TwoTierCache[ChannelMessageRef](
+            "MAPPING_CACHE", redis, "mapping", _encodeRef, _decodeRef,
+            ttl=settings.MAPPING_CACHE_TTL_SECONDS,
+            localSize=settings.MAPPING_CACHE_SIZE,
+            localTtl=settings.MAPPING_CACHE_LOCAL_TTL_SECONDS,
+        )
+
+    async def get(self, userChatId: int, userMessageId: int) -> Optional[ChannelMessageRef]:
+        return await self.cache.get((userChatId, userMessageId))
+
+    async def set(self, userChatId: int, userMessageId: int, ref: ChannelMessageRef) -> None:
+        await self.cache.set((userChatId, userMessageId), ref)
+
+    async def fill(self, userChatId: int, userMessageId: int, ref: ChannelMessageRef) -> None:
+        await self.cache.fill((userChatId, userMessageId), ref)
+
+    async def setMany(self, entries: Iterable[Tuple[Tuple[int, int], ChannelMessageRef]]) -> None:
+        """((userChatId, userMessageId), ref) pairs - one pipelined round trip"""
+        await self.cache.setMany(entries)
+
+    async def invalidate(self, keys: Iterable[Tuple[int, int]]) -> None:
+        """keys = (userChatId, userMessageId) pairs; None message ids are skipped"""
+        await self.cache.invalidate((chatId, messageId) for chatId, messageId in keys if messageId is not None)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
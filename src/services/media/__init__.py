@@ -1 +1,2 @@
 from .media_group_handler import *
+from .media_group_coordinator import *
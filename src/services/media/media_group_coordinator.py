@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from aiogram import Bot
+from redis.asyncio import Redis
+from config import settings, dbManager
+from common import LatencyTracker
+from db import UserRepository, MessageMappingRepository
+from services.moderation import NSFWChecker
+from services.reply_resolver import ReplyResolverService
+from services.background_tasks import BackgroundTaskSupervisor
+from services.messaging import ConfirmationService
+from services.mapping_cache import MappingCache
+from services.media.media_group_handler import MediaGroupHandler
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "media_groups:pending"
+
+# KEYS = buffer, processed, last-arrival, pending zset, meta, first-claim
+# ARGV = item, ttlMs, groupId, meta ('' = none), messageId
+# meta is stored NX in the same step as the item, so a flush can never see an item without it
+# returns the buffer length, or -1 when the group was already flushed (late item)
+PUSH_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return -1
+end
+if ARGV[4] ~= '' then
+    redis.call('SET', KEYS[5], ARGV[4], 'PX', ARGV[2], 'NX')
+end
+redis.call('SET', KEYS[6], ARGV[5], 'PX', ARGV[2], 'NX')
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local count = redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+redis.call('SET', KEYS[3], now, 'PX', ARGV[2])
+redis.call('ZADD', KEYS[4], 'NX', now, ARGV[3])
+return count
+"""
+
+# KEYS = lease, buffer, last-arrival, pending zset | ARGV = token, leaseMs, groupId
+# renews the lease if we still own it; returns {count, idleMs, ageMs} or nil if the lease is lost
+STATE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return nil
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local last = tonumber(redis.call('GET', KEYS[3]) or now)
+local first = tonumber(redis.call('ZSCORE', KEYS[4], ARGV[3]) or now)
+return {redis.call('LLEN', KEYS[2]), now - last, now - first}
+"""
+
+# KEYS = lease, processed, buffer, meta, first-claim, last-arrival, pending zset | ARGV = token, processedTtlMs, groupId
+# owner only: mark processed (late items are refused from here on) and take the whole buffer
+FLUSH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return nil
+end
+redis.call('SET', KEYS[2], '1', 'PX', ARGV[2])
+local items = redis.call('LRANGE', KEYS[3], 0, -1)
+local meta = redis.call('GET', KEYS[4]) or ''
+redis.call('DEL', KEYS[1], KEYS[3], KEYS[4], KEYS[5], KEYS[6])
+redis.call('ZREM', KEYS[7], ARGV[3])
+return {meta, items}
+"""
+
+@dataclass
+class PendingGroup:
+    lastAt: float
+    arrived: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Task | None = None
+
+class MediaGroupCoordinator:
+    """
+    debounced, multi-replica safe album flush (singleton on dp)
+
+    buffering - one lua script refuses late items for flushed groups, RPUSHes the item,
+      stamps the last arrival and registers the group in the pending zset (first arrival = score)
+    election  - whichever replica wins SET NX PX on media_group_lease:{groupId} coordinates;
+      the owner renews the lease on every check, so if it dies the lease simply expires
+    takeover  - every replica sweeps the pending zset and claims groups that are past their
+      deadline with an expired lease - albums survive a crashed coordinator
+    flush     - owner-only script marks the group processed and takes the whole buffer atomically,
+      as soon as
+      - MEDIA_GROUP_MAX_ITEMS items are in (telegram caps albums at 10)
+      - no new item for the idle interval - adaptive: MEDIA_GROUP_IDLE_FACTOR x the observed
+        gap between album items, clamped to MEDIA_GROUP_IDLE_MIN/MAX_MS
+      - MEDIA_GROUP_MAX_WAIT_SECONDS passed since the first item (hard deadline)
+
+    idle/age come from redis TIME, so items that land on other replicas count too;
+    local arrivals just wake the coordinator early
+
+    the album is processed in its own DB session - the update that started it is long done
+    """
+    def __init__(
+        self,
+        bot: Bot,
+        redis: Redis,
+        nsfwChecker: NSFWChecker,
+        taskSupervisor: BackgroundTaskSupervisor,
+        confirmationService: ConfirmationService,
+        mappingCache: MappingCache
+    ):
+        self.bot = bot
+        self.redis = redis
+        self.nsfwChecker = nsfwChecker
+        self.taskSupervisor = taskSupervisor
+        self.confirmationService = confirmationService
+        self.mappingCache = mappingCache
+        self.token = uuid.uuid4().hex
+        self._groups: Dict[str, PendingGroup] = {}
+        self._gapMs = settings.MEDIA_GROUP_IDLE_MIN_MS / settings.MEDIA_GROUP_IDLE_FACTOR
+        self._sweeper: asyncio.Task | None = None
+        self._pushScript = redis.register_script(PUSH_SCRIPT)
+        self._stateScript = redis.register_script(STATE_SCRIPT)
+        self._flushScript = redis.register_script(FLUSH_SCRIPT)
+        self.albumLatency = LatencyTracker("media_group_album", reportEvery=20)
+
+    def start(self) -> None:
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep(), name="media-group-sweeper")
+
+    async def close(self) -> None:
+        if self._sweeper:
+            self._sweeper.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._sweeper
+            self._sweeper = None
+
+    def idleTimeout(self) -> float:
+        idleMs = self._gapMs * settings.MEDIA_GROUP_IDLE_FACTOR
+        idleMs = min(max(idleMs, settings.MEDIA_GROUP_IDLE_MIN_MS), settings.MEDIA_GROUP_IDLE_MAX_MS)
+        return idleMs / 1000
+
+    @staticmethod
+    def _keys(groupId: str) -> dict:
+        return {
+            "buffer": f"media_group:{groupId}",
+            "meta": f"media_group_meta:{groupId}",
+            "first": f"media_group_first:{groupId}",
+            "last": f"media_group_last:{groupId}",
+            "lease": f"media_group_lease:{groupId}",
+            "processed": f"media_group_processed:{groupId}",
+        }
+
+    async def push(self, groupId: str, item: dict, meta: Optional[dict] = None) -> Optional[int]:
+        """
+        buffer an item; returns the buffer length or None if the group was already flushed
+        meta (album-wide reply/quote data) is kept only if no earlier item brought one
+        """
+        keys = self._keys(groupId)
+        count = await self._pushScript(
+            keys=[keys["buffer"], keys["processed"], keys["last"], PENDING_KEY, keys["meta"], keys["first"]],
+            args=[
+                json.dumps(item), settings.MEDIA_GROUP_BUFFER_TTL_SECONDS * 1000, groupId,
+                json.dumps(meta) if meta else "", item["messageId"]
+            ]
+        )
+        if count < 0:
+            return None
+        await self._notify(groupId)
+        return count
+
+    async def _notify(self, groupId: str) -> None:
+        now = time.monotonic()
+        group = self._groups.get(groupId)
+        if group is not None:
+            # EWMA of the gap between album items drives the idle interval
+            gapMs = (now - group.lastAt) * 1000
+            self._gapMs = 0.8 * self._gapMs + 0.2 * gapMs
+            group.lastAt = now
+            group.arrived.set()
+            return
+        if await self._acquireLease(groupId):
+            self._startGroup(groupId)
+
+    async def _acquireLease(self, groupId: str) -> bool:
+        return bool(await self.redis.set(
+            self._keys(groupId)["lease"], self.token, nx=True, px=settings.MEDIA_GROUP_LEASE_MS
+        ))
+
+    def _startGroup(self, groupId: str) -> None:
+        group = self._groups[groupId] = PendingGroup(lastAt=time.monotonic())
+        group.task = self.taskSupervisor.spawn(self._run(groupId, group), name=f"media-group-{groupId}")
+        if group.task is None:
+            # shutting down - lease lapses and another replica's sweeper picks the album up
+            self._groups.pop(groupId, None)
+
+    async def _run(self, groupId: str, group: PendingGroup) -> None:
+        keys = self._keys(groupId)
+        maxWaitMs = settings.MEDIA_GROUP_MAX_WAIT_SECONDS * 1000
+        # renew well before the lease could lapse
+        maxSleep = settings.MEDIA_GROUP_LEASE_MS / 3000
+        try:
+            while True:
+                state = await self._stateScript(
+                    keys=[keys["lease"], keys["buffer"], keys["last"], PENDING_KEY],
+                    args=[self.token, settings.MEDIA_GROUP_LEASE_MS, groupId]
+                )
+                if state is None:
+                    logger.warning(f"[MEDIA_GROUP] lost lease on group {groupId} - another replica took over")
+                    return
+                count, idleMs, ageMs = (int(value) for value in state)
+                if count >= settings.MEDIA_GROUP_MAX_ITEMS:
+                    reason = "full"
+                    break
+                if ageMs >= maxWaitMs:
+                    reason = "deadline"
+                    break
+                idleLeft = self.idleTimeout() - idleMs / 1000
+                if count and idleLeft <= 0:
+                    reason = "idle"
+                    break
+                group.arrived.clear()
+                timeout = min(max(idleLeft, 0.05), (maxWaitMs - ageMs) / 1000, maxSleep)
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(group.arrived.wait(), timeout=timeout)
+            await self._flush(groupId, reason, ageMs)
+        except Exception as e:
+            logger.error(f"error coordinating group {groupId}: {e}", exc_info=True)
+        finally:
+            self._groups.pop(groupId, None)
+
+    async def _flush(self, groupId: str, reason: str, ageMs: int) -> None:
+        keys = self._keys(groupId)
+        started = time.monotonic()
+        result = await self._flushScript(
+            keys=[
+                keys["lease"], keys["processed"], keys["buffer"], keys["meta"],
+                keys["first"], keys["last"], PENDING_KEY
+            ],
+            args=[self.token, settings.MEDIA_GROUP_BUFFER_TTL_SECONDS * 1000, groupId]
+        )
+        if result is None:
+            logger.warning(f"[MEDIA_GROUP] lost lease on group {groupId} before flush")
+            return
+        rawMeta, rawItems = result
+        if not rawItems:
+            logger.warning(f"no buffer data found for group {groupId}")
+            return
+
+        bufferData = json.loads(rawMeta) if rawMeta else {}
+        bufferData['messageIds'] = [json.loads(item) for item in rawItems]
+        bufferData.setdefault('userId', bufferData['messageIds'][0]['userId'])
+        logger.info(
+            f"[MEDIA_GROUP] flushing group {groupId} ({len(rawItems)} items, reason={reason}, "
+            f"waited {ageMs}ms, idle={self.idleTimeout() * 1000:.0f}ms)"
+        )
+
+        async with dbManager.session() as session:
+            messageMappingRepo = MessageMappingRepository(session, self.mappingCache)
+            handler = MediaGroupHandler(
+                self.bot,
+                UserRepository(session),
+                messageMappingRepo,
+                ReplyResolverService(self.bot, messageMappingRepo),
+                self.nsfwChecker,
+                self.redis,
+                self,
+                self.confirmationService,
+            )
+            await handler.processGroup(groupId, bufferData)
+        self.albumLatency.record(ageMs + (time.monotonic() - started) * 1000)
+
+    async def _sweep(self) -> None:
+        """claim groups whose coordinator went away (deadline passed, lease expired)"""
+        while True:
+            await asyncio.sleep(settings.MEDIA_GROUP_SWEEP_INTERVAL_SECONDS)
+            try:
+                seconds, micros = await self.redis.time()
+                nowMs = seconds * 1000 + micros // 1000
+                cutoff = nowMs - settings.MEDIA_GROUP_MAX_WAIT_SECONDS * 1000 - settings.MEDIA_GROUP_LEASE_MS
+                stale = await self.redis.zrangebyscore(PENDING_KEY, "-inf", cutoff)
+                for groupId in stale:
+                    if groupId in self._groups:
+                        continue
+                    if await self._acquireLease(groupId):
+                        logger.warning(f"[MEDIA_GROUP] taking over orphaned group {groupId}")
+                        self._startGroup(groupId)
+            except Exception as e:
+                logger.error(f"[MEDIA_GROUP] sweep failed: {e}", exc_info=True)
@@ -1,20 +1,21 @@
-import asyncio
 import json
 import logging
-from typing import List
+from typing import List, TYPE_CHECKING
 from aiogram import Bot
 from aiogram.types import (
     Message, 
     InputMediaPhoto, 
     InputMediaVideo, 
     InputMediaDocument,
-    ReplyParameters
+    MessageEntity,
 )
 from db import UserRepository, MessageMappingRepository
 from services.moderation import NSFWChecker
 from services.reply_resolver import ReplyResolverService
+from services.messaging import ConfirmationService
 from common import (
     buildNSFWPromptKeyboard,
+    CaptionBuilder,
     MappingUtil,
     InputMediaType,
     ReplyParametersBuilder,
@@ -22,6 +23,9 @@ from common import (
 from config import settings
 from redis.asyncio import Redis
 
+if TYPE_CHECKING:
+    from services.media.media_group_coordinator import MediaGroupCoordinator
+
 logger = logging.getLogger(__name__)
 
 class MediaGroupHandler:
@@ -32,7 +36,9 @@ class MediaGroupHandler:
         messageMappingRepo: MessageMappingRepository,
         replyResolver: ReplyResolverService,
         nsfwChecker: NSFWChecker,
-        redis: Redis
+        redis: Redis,
+        coordinator: "MediaGroupCoordinator",
+        confirmationService: ConfirmationService
     ):
         self.bot = bot
         self.userRepo = userRepo
@@ -40,100 +46,75 @@ class MediaGroupHandler:
         self.nsfwChecker = nsfwChecker
         self.replyResolver = replyResolver
         self.redis = redis
+        self.coordinator = coordinator
+        self.confirmationService = confirmationService
     
     async def handleMediaGroupMessage(self, message: Message, user) -> None:
-        """collect n batch media group messages"""
+        """
+        buffer an album item (atomic append, see MediaGroupCoordinator.push)
+        and let the coordinator decide when the album is complete
+        """
         groupId = message.media_group_id
-        bufferKey = f"media_group:{groupId}"
-        counterKey = f"media_group_counter:{groupId}"
-        processedKey = f"media_group_processed:{groupId}"
-        
-        if await self.redis.get(processedKey):
+        processed, claimed = await self.redis.mget(
+            f"media_group_processed:{groupId}", f"media_group_first:{groupId}"
+        )
+        if processed:
             logger.info(f"group {groupId} already processed, skipping message {message.message_id}")
             return
         
-        count = await self.redis.incr(counterKey)
-        await self.redis.expire(counterKey, 10)
+        # until some item has been pushed, every item brings the album-wide reply/quote data;
+        # the push script keeps the first one atomically with that item
+        meta = None if claimed else await self._buildGroupMeta(message, user)
+        count = await self.coordinator.push(groupId, {
+            'messageId': message.message_id,
+            'chatId': message.chat.id,
+            'userId': user.id,
+            **self._describeMedia(message)
+        }, meta=meta)
+        if count is None:
+            # the group got flushed between the check above and the push (checked atomically there)
+            logger.warning(f"group {groupId} flushed before message {message.message_id} arrived - dropped")
+            return
+        logger.info(f"message {message.message_id} added to group {groupId} (count: {count})")
+
+    async def _buildGroupMeta(self, message: Message, user) -> dict:
         replyChannelMessageId = None
         replyChannelChatId = None
-        if count == 1:
-            if message.reply_to_message:
-                mapping = await self.messageMappingRepo.getByUserMessageOrLastEditMessage(
-                    userChatId=message.reply_to_message.chat.id,
-                    userMessageId=message.reply_to_message.message_id
+        if message.reply_to_message:
+            mapping = await self.messageMappingRepo.resolveChannelMessage(
+                userChatId=message.reply_to_message.chat.id,
+                userMessageId=message.reply_to_message.message_id
+            )
+            if mapping:
+                replyChannelMessageId = mapping.channelMessageId
+                replyChannelChatId = mapping.channelChatId
+                logger.info(
+                    f"[MEDIA_GROUP_REPLY] found reply mapping for group: "
+                    f"userMessage={message.reply_to_message.message_id} -> "
+                    f"channelMessageId={replyChannelMessageId}, channelChatId={replyChannelChatId}"
+                )
+        elif message.external_reply:
+            externalReply = message.external_reply
+            if externalReply.chat and externalReply.chat.id == settings.CHANNEL_ID:
+                replyChannelMessageId = externalReply.message_id
+                replyChannelChatId = externalReply.chat.id
+                logger.info(
+                    f"[MEDIA_GROUP_REPLY] external reply to channel message: "
+                    f"messageId={replyChannelMessageId}, chatId={replyChannelChatId}"
                 )
-                if mapping:
-                    replyChannelMessageId = mapping.channelMessageId
-                    replyChannelChatId = mapping.channelChatId
-                    logger.info(
-                        f"[MEDIA_GROUP_REPLY] found reply mapping for group: "
-                        f"userMessage={message.reply_to_message.message_id} -> "
-                        f"channelMessageId={replyChannelMessageId}, channelChatId={replyChannelChatId}"
-                    )
-            elif message.external_reply:
-                externalReply = message.external_reply
-                if externalReply.chat and externalReply.chat.id == settings.CHANNEL_ID:
-                    replyChannelMessageId = externalReply.message_id
-                    replyChannelChatId = externalReply.chat.id
-                    logger.info(
-                        f"[MEDIA_GROUP_REPLY] external reply to channel message: "
-                        f"messageId={replyChannelMessageId}, chatId={replyChannelChatId}"
-                    )
         
         quoteText = None
-        if count == 1 and message.quote and message.quote.text:
+        if message.quote and message.quote.text:
             quoteText = message.quote.text
             logger.info(f"[MEDIA_GROUP] saving quote text: {quoteText[:50]}...")
-
-        existingData = await self.redis.get(bufferKey)
-        if existingData:
-            bufferData = json.loads(existingData)
-            messageIds = bufferData.get('messageIds', [])
-            if not replyChannelMessageId and 'replyToMessageId' in bufferData:
-                replyChannelMessageId = bufferData.get('replyToMessageId')
-                replyChannelChatId = bufferData.get('replyToChatId')
-        else: 
-            messageIds = []
-        
-        messageIds.append({
-            'messageId': message.message_id,
-            'chatId': message.chat.id,
-            'userId': user.id
-        })
-        bufferData = {
-            'messageIds': messageIds,
+        return {
             'userId': user.id,
             'replyToMessageId': replyChannelMessageId,
             'replyToChatId': replyChannelChatId,
             'quoteText': quoteText
         }
-        await self.redis.setex(bufferKey, 10, json.dumps(bufferData))
-        if count == 1:
-            logger.info(f"message {message.message_id} spawning coordinator for group {groupId}")
-            asyncio.create_task(self._coordinateGroup(groupId))
-        else:
-            logger.info(f"message {message.message_id} added to group {groupId} (count: {count})")
 
-    async def _coordinateGroup(self, groupId: str):
-        bufferKey = f"media_group:{groupId}"
-        processedKey = f"media_group_processed:{groupId}"
-        counterKey = f"media_group_counter:{groupId}"
-        try:
-            await asyncio.sleep(2)
-            finalData = await self.redis.get(bufferKey)
-            if not finalData:
-                logger.warning(f"no buffer data found for group {groupId}")
-                return
-            
-            finalBuffer = json.loads(finalData)
-            await self.redis.setex(processedKey, 10, "1")
-            await self._processGroup(groupId, finalBuffer)
-            await self.redis.delete(bufferKey)
-            await self.redis.delete(counterKey)
-        except Exception as e:
-            logger.error(f"error coordinating group {groupId}: {e}", exc_info=True)
-    
-    async def _processGroup(self, groupId: str, bufferData: dict):
+    async def processGroup(self, groupId: str, bufferData: dict):
         messageIds = bufferData['messageIds']
         userId = bufferData['userId']
         
@@ -163,31 +144,28 @@ class MediaGroupHandler:
 
     async def _handleNSFWCheck(self, messageIds: List[dict], user, chatId: int, bufferData: dict):
         if settings.ENFORCED_NSFW_CHECK:
-            firstMessage = await self.bot.forward_message(
-                chat_id=chatId,
-                from_chat_id=chatId,
-                message_id=messageIds[0]['messageId']
-            )
-            await self.bot.delete_message(chatId, firstMessage.message_id)
-            isSafe, reason = await self.nsfwChecker.checkMessage(self.bot, firstMessage)
-            hasSpoiler = False
-            if not isSafe:
-                logger.warning(f"nsfw album detected from user {user.telegramId}")
+            verdicts = await self.nsfwChecker.checkMediaItems(self.bot, messageIds)
+            spoilers = [not isSafe for isSafe, _ in verdicts]
+            if any(spoilers):
+                reason = next(reason for isSafe, reason in verdicts if not isSafe)
+                logger.warning(
+                    f"nsfw album detected from user {user.telegramId} "
+                    f"({sum(spoilers)}/{len(spoilers)} items)"
+                )
                 await self.bot.send_message(
                     chat_id=chatId,
                     text=(
                         f"<b>🔞 NSFW content detected</b>\n\n"
                         f"Reason: {reason}\n"
-                        f"Your post will be sent with spoilers"
+                        f"{sum(spoilers)} of {len(spoilers)} items will be sent with spoilers"
                     ),
                     parse_mode="HTML"
                 )
-                hasSpoiler = True
             await self.sendToChannel(
                 messageIds,
                 user,
                 chatId,
-                hasSpoiler=hasSpoiler,
+                spoilers=spoilers,
                 forceReplyToMessageId=bufferData.get('replyToMessageId'),
                 forceReplyToChatId=bufferData.get('replyToChatId'),
                 forceQuoteText=bufferData.get('quoteText'),
@@ -202,6 +180,7 @@ class MediaGroupHandler:
         data = {
             'userId': user.id,
             'messageIds': [m['messageId'] for m in messageIds],
+            'items': messageIds,
             'chatId': chatId,
             'replyToMessageId': bufferData.get('replyToMessageId'),
             'replyToChatId': bufferData.get('replyToChatId'),
@@ -229,14 +208,14 @@ class MediaGroupHandler:
         forceReplyToMessageId: int = None,
         forceReplyToChatId: int = None,
         forceQuoteText: str = None,
-        alias: str = None
+        alias: str = None,
+        spoilers: List[bool] | None = None
     ) -> None:
+        """spoilers - per item flags (same order as messageIds), overrides hasSpoiler"""
+        if spoilers is None:
+            spoilers = [hasSpoiler] * len(messageIds)
+        hasSpoiler = any(spoilers)
         try:
-            firstOriginalMessage = await self.bot.forward_message(
-                chat_id=chatId,
-                from_chat_id=chatId,
-                message_id=messageIds[0]['messageId']
-            )
             if forceReplyToMessageId and forceReplyToChatId:
                 logger.info(
                     f"[MEDIA_GROUP] using forced reply params "
@@ -250,7 +229,9 @@ class MediaGroupHandler:
                     source="MEDIA_GROUP_FORCED"
                 )
             else:
-                replyParams = await self.replyResolver.resolve(firstOriginalMessage, settings.CHANNEL_ID)
+                # direct/external replies were already resolved into the buffer, only a link in the caption is left
+                firstCaption = messageIds[0].get('caption')
+                replyParams = await self.replyResolver.resolveLink(firstCaption) if firstCaption else None
                 if replyParams:
                     logger.info(
                         f"[MEDIA_GROUP] == OK == reply params: "
@@ -258,27 +239,14 @@ class MediaGroupHandler:
                     )
                 else:
                     logger.warning(f"[MEDIA_GROUP] == X == NO REPLY PARAMS")            
-            await self.bot.delete_message(chatId, firstOriginalMessage.message_id)
 
-            logger.info(f"[MEDIA_GROUP] fetching {len(messageIds)} messages in order...")
-            messages = []
-            for idx, messageData in enumerate(messageIds):
-                logger.debug(f"[MEDIA_GROUP] fetching message {idx + 1}/{len(messageIds)}: {messageData['messageId']}")
-                message = await self.bot.forward_message(
-                    chat_id=chatId,
-                    from_chat_id=chatId,
-                    message_id=messageData['messageId']
-                )
-                messages.append(message)
-                await self.bot.delete_message(chatId, message.message_id)
-            
-            logger.info(f"[MEDIA_GROUP] all {len(messages)} messages fetched in order")
             mediaGroup = []
-            for idx, message in enumerate(messages):
+            for idx, item in enumerate(messageIds):
+                parseMode = None
                 if idx == 0:
-                    from common import CaptionBuilder
-                    caption, parseMode = CaptionBuilder.buildCaption(
-                        message,
+                    caption, parseMode = CaptionBuilder.buildCaptionFromParts(
+                        item.get('caption'),
+                        [MessageEntity.model_validate(entity) for entity in item.get('captionEntities') or []],
                         addWarning=addWarning,
                         isReplyLinkToBeRemoved=True,
                         hasReply=bool(replyParams),
@@ -287,7 +255,7 @@ class MediaGroupHandler:
                         caption = (caption or "") + f"\n✍️ <i>{alias}</i>"
                         parseMode = "HTML"
                 else: caption = None
-                mediaItem = self._resolveMediaItemType(message, caption, hasSpoiler, parseMode)
+                mediaItem = self._buildMediaItem(item, caption, spoilers[idx], parseMode)
                 if mediaItem:
                     mediaGroup.append(mediaItem)
                     logger.debug(
@@ -297,7 +265,7 @@ class MediaGroupHandler:
                     )
                 else:
                     logger.warning(
-                        f"[MEDIA_GROUP] message {message.message_id} at position {idx} "
+                        f"[MEDIA_GROUP] message {item['messageId']} at position {idx} "
                         f"had no recognizable media - skipping"
                     )
             
@@ -326,87 +294,88 @@ class MediaGroupHandler:
                 )
             logger.info(f"[MEDIA_GROUP] successfully sent {len(sentMessages)} items")
 
-            for messageData, sentMessage in zip(messageIds, sentMessages):
-                await MappingUtil.createAndLog(
-                    self.messageMappingRepo,
-                    userId=user.id,
-                    userChatId=messageData['chatId'],
-                    userMessageId=messageData['messageId'],
-                    channelChatId=sentMessage.chat.id,
-                    channelMessageId=sentMessage.message_id
-                )
+            await MappingUtil.createAndLogBulk(self.messageMappingRepo, [
+                {
+                    "userId": user.id,
+                    "userChatId": messageData['chatId'],
+                    "userMessageId": messageData['messageId'],
+                    "channelChatId": sentMessage.chat.id,
+                    "channelMessageId": sentMessage.message_id,
+                    "channelMediaGroupId": sentMessage.media_group_id,
+                }
+                for messageData, sentMessage in zip(messageIds, sentMessages)
+            ])
             
-            from common import buildMessageActionsKeyboard
-            keyboard = buildMessageActionsKeyboard(
-                sentMessages[0].message_id,
-                canEdit=False
-            )
             confirmText = "😘😍 Message sent"
             confirmText += " with 😍NSFW😍 spoilers 🔞" if hasSpoiler else " to the channel 😚☺️😽"
-            try:
-                await self.bot.send_message(
-                    chat_id=chatId,
-                    text=confirmText,
-                    reply_parameters=ReplyParameters(
-                        message_id=sentMessages[0].message_id,
-                        chat_id=settings.CHANNEL_ID
-                    ),
-                    reply_markup=keyboard
-                )
-            except Exception as e:
-                logger.warning(f"[MEDIA_GROUP] cross-chat reply failed: {e}, sending without")
-                await self.bot.send_message(
-                    chat_id=chatId,
-                    text=confirmText,
-                    reply_markup=keyboard
-                )
-            if len(sentMessages) > 1:
-                firstId = sentMessages[0].message_id
-                siblingIds = [message.message_id for message in sentMessages[1:]]
-                await self.redis.setex(
-                    f"media_group_siblings:{firstId}",
-                    604800,  # 7 days
-                    json.dumps(siblingIds)
-                )
-                logger.debug(
-                    f"[MEDIA_GROUP] stored {len(siblingIds)} sibling IDs "
-                    f"for first message {firstId}"
-                )
+            self.confirmationService.confirm(
+                chatId,
+                userMessageId=messageIds[0]['messageId'],
+                channelMessageId=sentMessages[0].message_id,
+                canEdit=False,
+                text=confirmText
+            )
         except Exception as e:
             logger.error(f"[MEDIA_GROUP] error sending media group: {e}", exc_info=True)
             raise
 
     @staticmethod
-    def _resolveMediaItemType(
-        message: Message, 
+    def _describeMedia(message: Message) -> dict:
+        """
+        everything needed to rebuild the album item (file id, type, caption, entities)
+        kept in the buffer - no forward/delete round trips to get the messages back
+        """
+        if message.photo:
+            media, mediaType = message.photo[-1], "photo"
+        elif message.video:
+            media, mediaType = message.video, "video"
+        elif message.animation:
+            media, mediaType = message.animation, "animation"
+        elif message.document:
+            media, mediaType = message.document, "document"
+        else:
+            return {'mediaType': None, 'caption': message.caption, 'captionEntities': []}
+        return {
+            'mediaType': mediaType,
+            'fileId': media.file_id,
+            'fileUniqueId': media.file_unique_id,
+            'caption': message.caption,
+            'captionEntities': [
+                entity.model_dump(mode="json", exclude_none=True)
+                for entity in message.caption_entities or []
+            ],
+        }
+
+    @staticmethod
+    def _buildMediaItem(
+        item: dict,
         caption: str | None = None,
         hasSpoiler: bool = False, 
         parseMode: str | None = None,
     ) -> InputMediaType | None:
         """
-        convert Message to an InputMedia* object for send_media_group.
+        convert a buffered album item to an InputMedia* object for send_media_group.
         
         NOTE: 
         InputMediaType = InputMediaPhoto | InputMediaVideo | InputMediaDocument
         """
         kwargs = {"caption": caption, "parse_mode": parseMode}
-        if message.photo:
+        mediaType = item.get('mediaType')
+        if mediaType == "photo":
             return InputMediaPhoto(
-                media=message.photo[-1].file_id, 
+                media=item['fileId'], 
                 has_spoiler=hasSpoiler, 
                 **kwargs
             )
-        
-        videoObj = message.video or message.animation
-        if videoObj:
+        if mediaType in ("video", "animation"):
             return InputMediaVideo(
-                media=videoObj.file_id, 
+                media=item['fileId'], 
                 has_spoiler=hasSpoiler, 
                 **kwargs
             )
-        if message.document:
+        if mediaType == "document":
             return InputMediaDocument(
-                media=message.document.file_id, 
+                media=item['fileId'], 
                 **kwargs
             )    
         return None
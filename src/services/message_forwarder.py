@@ -1,22 +1,29 @@
+import asyncio
+import time
+from collections import Counter
+from functools import cached_property
+from typing import Dict, Optional, Tuple
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, ReplyParameters
-from db import UserRepository, MessageMappingRepository
+from db import UserRepository, MessageMappingRepository, UserSnapshot
 from services.reply_resolver import ReplyResolverService
-from services.rate_limiting import RateLimiterService
-from services.media import MediaGroupHandler
-from services.messaging import MessageDispatcher
+from services.rate_limiting import RateLimiterService, RateLimitResult
+from services.media import MediaGroupHandler, MediaGroupCoordinator
+from services.messaging import MessageDispatcher, ConfirmationService
 from services.moderation import NSFWChecker, NSFWDataManager
 from services.subscription_checker import SubscriptionCheckerService
 from common import (
-    buildMessageActionsKeyboard,
     buildNSFWPromptKeyboard,
     buildAliasKeyboard,
     MappingUtil,
     TelegramLinkParser,
     ReplyParametersBuilder,
     entitiesToHtml,
+    LatencyTracker,
 )
 from exceptions import (
+    ChannelPostError,
     MessageForwardError,
     RateLimitExceeded,
     NotSubscribedError,
@@ -26,6 +33,41 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+PREFLIGHT_GUARDS = ("user", "subscription", "rateLimit")
+
+class PreflightStats:
+    """
+    per-guard latency of the forward pre-flight (process wide - the forwarder is per update);
+    the slowest guard of every complete run is counted as the dominant one
+    """
+    def __init__(self, reportEvery: int = 500):
+        self.reportEvery = reportEvery
+        self.runs = 0
+        self.dominant: Counter = Counter()
+        self.trackers = {guard: LatencyTracker(f"preflight_{guard}") for guard in PREFLIGHT_GUARDS}
+
+    def record(self, timings: Dict[str, float]) -> None:
+        for guard, ms in timings.items():
+            self.trackers[guard].record(ms)
+        if len(timings) < len(PREFLIGHT_GUARDS):
+            # short-circuited - the cancelled guard has no timing
+            return
+        self.runs += 1
+        self.dominant[max(timings, key=timings.get)] += 1
+        if self.runs % self.reportEvery == 0:
+            logger.info(f"[PREFLIGHT] {self.summary()}")
+
+    def summary(self) -> dict:
+        return {
+            "runs": self.runs,
+            "dominantPct": {
+                guard: round(count * 100 / self.runs) for guard, count in self.dominant.most_common()
+            } if self.runs else {},
+            **{guard: tracker.summary() for guard, tracker in self.trackers.items()},
+        }
+
+preflightStats = PreflightStats()
+
 class MessageForwarderService:
     def __init__(
         self,
@@ -35,7 +77,10 @@ class MessageForwarderService:
         replyResolver: ReplyResolverService,
         rateLimiter: RateLimiterService,
         nsfwChecker: NSFWChecker,
-        redis
+        redis,
+        subscriptionChecker: SubscriptionCheckerService,
+        mediaGroupCoordinator: MediaGroupCoordinator,
+        confirmationService: ConfirmationService
     ):
         self.bot = bot
         self.userRepo = userRepo
@@ -44,47 +89,145 @@ class MessageForwarderService:
         self.rateLimiter = rateLimiter
         self.nsfwChecker = nsfwChecker
         self.redis = redis
+        self.subscriptionChecker = subscriptionChecker
+        self.mediaGroupCoordinator = mediaGroupCoordinator
+        self.confirmationService = confirmationService
         self.CHANNEL_ID = settings.CHANNEL_ID
 
-        self.dispatcher = MessageDispatcher(bot, self.CHANNEL_ID)
-        self.mediaGroupHandler = MediaGroupHandler(
-            bot, userRepo, messageMappingRepo, replyResolver, nsfwChecker, redis
+    # -- collaborators are built on first use only; most updates touch one or two of them
+    @cached_property
+    def dispatcher(self) -> MessageDispatcher:
+        return MessageDispatcher(self.bot, self.CHANNEL_ID)
+
+    @cached_property
+    def mediaGroupHandler(self) -> MediaGroupHandler:
+        return MediaGroupHandler(
+            self.bot,
+            self.userRepo,
+            self.messageMappingRepo,
+            self.replyResolver,
+            self.nsfwChecker,
+            self.redis,
+            self.mediaGroupCoordinator,
+            self.confirmationService
         )
-        self.nsfwDataManager = NSFWDataManager(redis)
-        self.subscriptionChecker = SubscriptionCheckerService(bot, self.CHANNEL_ID)
+
+    @cached_property
+    def nsfwDataManager(self) -> NSFWDataManager:
+        return NSFWDataManager(self.redis)
 
     async def forwardMessage(self, message: Message) -> None:
         self._logIncoming(message)
-        user = await self.userRepo.getOrCreate(
-            telegramId=message.from_user.id,
-            username=message.from_user.username,
-            firstName=message.from_user.first_name or "",
-            lastName=message.from_user.last_name
-        )
-        if user.isBanned:
-            await message.reply("❌ You are banned from using this bot 🚮")
+        preflight = await self._preflight(message)
+        if preflight is None:
             return
+        user, charge = preflight
 
-        isSubscribed, subStatus = await self.subscriptionChecker.isSubscribed(message.from_user.id)
-        if not isSubscribed:
-            logger.info(f"[SUB_CHECK] user {message.from_user.id} blocked - status={subStatus}")
-            if user.alias:
-                await self.userRepo.clearAlias(user.id)
-                logger.info(f"[SUB_CHECK] cleared alias for unsubscribed user {user.telegramId}")
-            raise NotSubscribedError(status=subStatus)
-
-        await self.rateLimiter.checkRateLimit(message.from_user.id)
         if message.media_group_id:
             await self.mediaGroupHandler.handleMediaGroupMessage(message, user)
             return
 
-        hasMedia = message.photo or message.video or message.animation
-        if settings.ENABLE_NSFW_CHECK and hasMedia:
-            await self._handleNSFWCheck(message, user)
-        else:
-            await self._sendToChannel(message, user)
+        # the charge taken in preflight only sticks if the post reaches the channel now;
+        # a prompted post is charged when the user answers (recordPost)
+        posted = False
+        try:
+            hasMedia = message.photo or message.video or message.animation
+            if settings.ENABLE_NSFW_CHECK and hasMedia:
+                posted = await self._handleNSFWCheck(message, user)
+            else:
+                await self._sendToChannel(message, user)
+                posted = True
+        finally:
+            if not posted:
+                await self._refundRateLimit(message.from_user.id, charge)
+
+    async def recordPost(self, userId: int) -> None:
+        """
+        charge a post that went out after the nsfw prompt - best effort, like the old
+        recordMessage: the user already passed the limit when the prompt was sent
+        """
+        try:
+            await self.rateLimiter.acquire(userId)
+        except Exception as e:
+            logger.warning(f"[RATE_LIMIT] failed to charge prompted post for user {userId}: {e}")
+
+    async def _preflight(self, message: Message) -> Optional[Tuple[UserSnapshot, RateLimitResult]]:
+        """
+        ban / subscription / rate-limit guards run concurrently - only the ban check needs
+        the user (a cached snapshot while the profile is unchanged). a ban stops waiting and
+        cancels the subscription check (a plain read); a rate-limit rejection doesn't, since
+        not subscribed still has to win over it (and clear the alias). the upsert and the
+        rate-limit script are always let finish: the session can't be left mid-flush, and
+        a charge that already landed is refunded
+        outcomes keep the old precedence: banned > not subscribed > rate limited
+        returns (user, charge), or None when the user is banned (already told so)
+        """
+        fromUser = message.from_user
+        timings: Dict[str, float] = {}
+        userTask = asyncio.create_task(self._timed("user", timings, self.userRepo.ensureUser(
+            telegramId=fromUser.id,
+            username=fromUser.username,
+            firstName=fromUser.first_name or "",
+            lastName=fromUser.last_name
+        )))
+        subTask = asyncio.create_task(self._timed(
+            "subscription", timings, self.subscriptionChecker.isSubscribed(fromUser.id)
+        ))
+        # atomic check + record; album items are charged once per media group
+        rateTask = asyncio.create_task(self._timed(
+            "rateLimit", timings, self.rateLimiter.acquire(fromUser.id, groupId=message.media_group_id)
+        ))
+        tasks = (userTask, subTask, rateTask)
+        rejected = True
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # only a ban outranks every other outcome - anything else waits for the rest
+                if userTask in done and (userTask.exception() is not None or userTask.result().isBanned):
+                    break
+            if not subTask.done():
+                subTask.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            user = userTask.result()
+            if user.isBanned:
+                await message.reply("❌ You are banned from using this bot 🚮")
+                return None
+            if not subTask.cancelled():
+                isSubscribed, subStatus = subTask.result()
+                if not isSubscribed:
+                    logger.info(f"[SUB_CHECK] user {fromUser.id} blocked - status={subStatus}")
+                    if user.alias:
+                        await self.userRepo.clearAlias(user.id)
+                        logger.info(f"[SUB_CHECK] cleared alias for unsubscribed user {user.telegramId}")
+                    raise NotSubscribedError(status=subStatus)
+            charge = rateTask.result()
+            self.rateLimiter.ensureAllowed(charge)
+            rejected = False
+            return user, charge
+        finally:
+            for task in tasks:
+                task.cancel()
+            if rejected and rateTask.done() and not rateTask.cancelled() and rateTask.exception() is None:
+                await self._refundRateLimit(fromUser.id, rateTask.result())
+            preflightStats.record(timings)
+
+    @staticmethod
+    async def _timed(guard: str, timings: Dict[str, float], coro):
+        started = time.perf_counter()
+        result = await coro
+        timings[guard] = (time.perf_counter() - started) * 1000
+        return result
+
+    async def _refundRateLimit(self, userId: int, charge: RateLimitResult) -> None:
+        try:
+            await self.rateLimiter.refund(userId, charge)
+        except Exception as e:
+            logger.warning(f"[RATE_LIMIT] refund failed for user {userId}: {e}")
 
-    async def _handleNSFWCheck(self, message: Message, user):
+    async def _handleNSFWCheck(self, message: Message, user) -> bool:
+        """True if the post went out now, False if it waits on the user's nsfw answer"""
         logger.info(f"[NSFW_CHECK] checking messageId - {message.message_id}")
         replyParams = await self.replyResolver.resolve(message, self.CHANNEL_ID)
         replyChannelMessageId = replyParams.message_id if replyParams else None
@@ -108,6 +251,7 @@ class MessageForwarderService:
                 forceReplyToChatId=replyChannelChatId,
                 forceQuoteText=quoteText
             )
+            return True
         else:
             await self.nsfwDataManager.storeSingleMedia(
                 messageId=message.message_id,
@@ -124,6 +268,7 @@ class MessageForwarderService:
                 parse_mode="HTML",
                 reply_markup=buildNSFWPromptKeyboard(message.message_id)
             )
+            return False
 
     async def _sendToChannel(
         self,
@@ -162,27 +307,33 @@ class MessageForwarderService:
                 overrideCaption = warningText + baseText
 
             alias = user.alias
-            result = await self.dispatcher.send(
-                message,
-                replyParams=replyParams,
-                hasSpoiler=hasSpoiler,
-                overrideCaption=overrideCaption,
-            )
+            replyMarkup = buildAliasKeyboard(alias) if alias else None
+            try:
+                result = await self.dispatcher.send(
+                    message,
+                    replyParams=replyParams,
+                    hasSpoiler=hasSpoiler,
+                    overrideCaption=overrideCaption,
+                    replyMarkup=replyMarkup,
+                )
+            except ChannelPostError as e:
+                # the alias keyboard is decoration - a rejected keyboard must not cost the post
+                if replyMarkup is None or not isinstance(e.__cause__, TelegramBadRequest):
+                    raise
+                logger.warning(f"[ALIAS] post with alias keyboard rejected ({e}) - retrying without it")
+                result = await self.dispatcher.send(
+                    message,
+                    replyParams=replyParams,
+                    hasSpoiler=hasSpoiler,
+                    overrideCaption=overrideCaption,
+                )
 
             if alias:
-                try:
-                    await self.bot.edit_message_reply_markup(
-                        chat_id=self.CHANNEL_ID,
-                        message_id=result.messageId,
-                        reply_markup=buildAliasKeyboard(alias)
-                    )
-                except Exception as e:
-                    logger.warning(f"[ALIAS] failed to attach alias keyboard to {result.messageId}: {e}")
+                # the comments button is only known once the discussion group copy arrives (group handler)
                 if settings.DISCUSSION_GROUP_ID:
                     await self.redis.setex(f"pending_alias:{result.messageId}", 60, alias)
                     logger.info(f"[ALIAS] stored pending alias for channel msg {result.messageId}")
 
-            await self.rateLimiter.recordMessage(message.from_user.id)
             mappingUserMessageId = originalUserMessageId or message.message_id
             await MappingUtil.createAndLog(
                 self.messageMappingRepo,
@@ -192,7 +343,13 @@ class MessageForwarderService:
                 channelChatId=result.chatId,
                 channelMessageId=result.messageId
             )
-            await self._sendConfirmation(message, result)
+            # deferred + coalesced - the post is done once it is in the channel
+            self.confirmationService.confirm(
+                message.chat.id,
+                userMessageId=mappingUserMessageId,
+                channelMessageId=result.messageId,
+                canEdit=result.canEdit
+            )
         except RateLimitExceeded:
             raise
         except Exception as e:
@@ -225,50 +382,6 @@ class MessageForwarderService:
             logger.info(f"[FORWARDER] no reply params")
         return replyParams
     
-    async def _sendConfirmation(self, originalMessage: Message, result) -> None:
-        keyboard = None
-        keyboard = buildMessageActionsKeyboard(result.messageId, canEdit=result.canEdit)
-        confirmationText = "😍 Your message was sent to the channel 💓💗"
-        try:
-            await self.bot.send_message(
-                chat_id=originalMessage.chat.id,
-                text=confirmationText,
-                reply_parameters=ReplyParameters(
-                    message_id=result.messageId,
-                    chat_id=result.chatId
-                ),
-                reply_markup=keyboard
-            )
-            logger.info(f"[CONFIRMATION] sent with cross-chat reply to channel message {result.messageId}")
-            return
-        except Exception as e:
-            logger.warning(f"[CONFIRMATION] cross-chat reply failed: {e}")
-        
-        try:
-            await self.bot.send_message(
-                chat_id=originalMessage.chat.id,
-                text=confirmationText,
-                reply_parameters=ReplyParameters(
-                    message_id=originalMessage.message_id
-                ),
-                reply_markup=keyboard
-            )
-            logger.info(f"[CONFIRMATION] sent with reply to USER MESSAGE {originalMessage.message_id}")
-            return
-        except Exception as e:
-            logger.warning(f"[CONFIRMATION] reply to user message failed: {e}")
-        
-        try:
-            await self.bot.send_message(
-                chat_id=originalMessage.chat.id,
-                text=confirmationText,
-                reply_markup=keyboard
-            )
-            logger.info(f"[CONFIRMATION] sent WITHOUT reply parameters")
-        except Exception as e:
-            logger.error(f"[CONFIRMATION] all attempts failed: {e}")
-            raise
-
     def _logIncoming(self, message: Message):
         logger.info(f"[FORWARD_START] {'=' * 5} NEW MESSAGE {'=' * 5}")
         logger.info(f"[FORWARD_START] messageId={message.message_id}, contentType={message.content_type}")
@@ -1 +1,3 @@
 from .message_dispatcher import *
+from .outbound_scheduler import *
+from .confirmation_service import *
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from aiogram import Bot
+from aiogram.types import ReplyParameters
+from redis.asyncio import Redis
+from config import settings
+from common import buildMessageActionsKeyboard, buildBatchActionsKeyboard
+from services.background_tasks import BackgroundTaskSupervisor
+from services.messaging.outbound_scheduler import Priority, withPriority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEXT = "😍 Your message was sent to the channel 💓💗"
+
+# reply strategies in fallback order
+STRATEGIES = ("channel", "user", "plain")
+
+@dataclass
+class PendingConfirmation:
+    userMessageId: int
+    channelMessageId: int
+    canEdit: bool
+    text: str
+
+class ConfirmationService:
+    """
+    "sent to the channel" confirmations, off the hot path (singleton on dp)
+
+    - confirm() only queues: the post is done once it is in the channel, the confirmation
+      goes out later on the LOW outbound lane as a supervised background task
+    - confirmations for one chat within CONFIRMATION_COALESCE_SECONDS of the first are merged
+      into a single message with one numbered edit/delete row per post; ones with their own
+      text (e.g. the nsfw spoiler note) go out alone so the note isn't lost
+    - the reply strategy that worked last for a chat (cross-chat reply to the channel post,
+      reply to the user's message, plain message) is remembered in redis and tried first;
+      without redis the default order is used
+
+    on shutdown flush() sends the batches still waiting out their coalesce delay right away,
+    so drain doesn't have to cancel them
+
+    merging is per replica - a burst spread over replicas yields one message per replica
+    """
+    def __init__(self, bot: Bot, redis: Redis, taskSupervisor: BackgroundTaskSupervisor):
+        self.bot = bot
+        self.redis = redis
+        self.taskSupervisor = taskSupervisor
+        self._pending: Dict[int, List[PendingConfirmation]] = {}
+        self._flushNow = asyncio.Event()
+        self.merged = 0
+
+    @staticmethod
+    def _strategyKey(chatId: int) -> str:
+        return f"confirm_strategy:{chatId}"
+
+    def confirm(
+        self,
+        chatId: int,
+        userMessageId: int,
+        channelMessageId: int,
+        canEdit: bool = True,
+        text: str = DEFAULT_TEXT
+    ) -> None:
+        item = PendingConfirmation(userMessageId, channelMessageId, canEdit, text)
+        if text != DEFAULT_TEXT:
+            self._spawn(chatId, [item], delay=0)
+            return
+        batch = self._pending.get(chatId)
+        if batch is not None and len(batch) < settings.CONFIRMATION_MAX_BATCH:
+            batch.append(item)
+            return
+        if batch is not None:
+            # full - send what we have now, this item starts a new batch
+            self._spawn(chatId, self._pending.pop(chatId), delay=0)
+        self._pending[chatId] = [item]
+        delay = 0 if self._flushNow.is_set() else settings.CONFIRMATION_COALESCE_SECONDS
+        self._spawn(chatId, self._pending[chatId], delay=delay)
+
+    def _spawn(self, chatId: int, batch: List[PendingConfirmation], delay: float) -> None:
+        task = self.taskSupervisor.spawn(self._flushLater(chatId, batch, delay), name=f"confirm-{chatId}")
+        if task is None:
+            logger.warning(f"[CONFIRMATION] shutting down - dropped {len(batch)} confirmations for chat {chatId}")
+            if self._pending.get(chatId) is batch:
+                del self._pending[chatId]
+
+    async def _flushLater(self, chatId: int, batch: List[PendingConfirmation], delay: float) -> None:
+        if delay:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._flushNow.wait(), timeout=delay)
+        if self._pending.get(chatId) is batch:
+            del self._pending[chatId]
+        if len(batch) > 1:
+            self.merged += len(batch) - 1
+            logger.info(f"[CONFIRMATION] merged {len(batch)} confirmations for chat {chatId}")
+        with withPriority(Priority.LOW):
+            await self._send(chatId, batch)
+
+    async def _send(self, chatId: int, batch: List[PendingConfirmation]) -> None:
+        last = batch[-1]
+        if len(batch) == 1:
+            text = last.text
+            keyboard = buildMessageActionsKeyboard(last.channelMessageId, canEdit=last.canEdit)
+        else:
+            text = f"😍 Your {len(batch)} messages were sent to the channel 💓💗"
+            keyboard = buildBatchActionsKeyboard([(item.channelMessageId, item.canEdit) for item in batch])
+
+        remembered = await self._getStrategy(chatId)
+        order = sorted(STRATEGIES, key=lambda strategy: strategy != remembered)
+        for strategy in order:
+            try:
+                await self.bot.send_message(
+                    chat_id=chatId,
+                    text=text,
+                    reply_parameters=self._replyParams(strategy, last),
+                    reply_markup=keyboard
+                )
+            except Exception as e:
+                logger.warning(f"[CONFIRMATION] {strategy} reply failed for chat {chatId}: {e}")
+                continue
+            if strategy != remembered:
+                await self._rememberStrategy(chatId, strategy)
+            logger.info(f"[CONFIRMATION] sent to chat {chatId} ({strategy}, {len(batch)} posts)")
+            return
+        logger.error(f"[CONFIRMATION] all attempts failed for chat {chatId}")
+
+    async def _getStrategy(self, chatId: int) -> Optional[str]:
+        try:
+            return await self.redis.get(self._strategyKey(chatId))
+        except Exception as e:
+            logger.warning(f"[CONFIRMATION] strategy lookup failed for chat {chatId}: {e}")
+            return None
+
+    async def _rememberStrategy(self, chatId: int, strategy: str) -> None:
+        try:
+            await self.redis.setex(self._strategyKey(chatId), settings.CONFIRMATION_STRATEGY_TTL_SECONDS, strategy)
+        except Exception as e:
+            logger.warning(f"[CONFIRMATION] failed to remember strategy for chat {chatId}: {e}")
+
+    @staticmethod
+    def _replyParams(strategy: str, item: PendingConfirmation) -> Optional[ReplyParameters]:
+        if strategy == "channel":
+            return ReplyParameters(message_id=item.channelMessageId, chat_id=settings.CHANNEL_ID)
+        if strategy == "user":
+            return ReplyParameters(message_id=item.userMessageId)
+        return None
+
+    def flush(self) -> None:
+        """stop coalescing - queued batches go out now (call before draining the task supervisor)"""
+        if self._pending:
+            logger.info(f"[CONFIRMATION] flushing {len(self._pending)} pending batches")
+        self._flushNow.set()
+
+    def stats(self) -> dict:
+        return {
+            "pendingChats": len(self._pending),
+            "pending": sum(len(batch) for batch in self._pending.values()),
+            "merged": self.merged,
+        }
@@ -22,11 +22,15 @@ class MessageDispatcher:
         overrideCaption: Optional[str] = None,
         threadId: Optional[int] = None,
         replyMarkup=None,
+        allowCopy: bool = True,
     ) -> SendResult:
         """
         send message to the channel based on its content type
         process:
         - look up message type config
+        - copy_message fast path when nothing about the message changes
+          (overrideCaption="" strips the caption, so it is an override too;
+          allowCopy=False for callers whose source message may already be gone)
         - build params using param builder for given content type
         - calls appropriate tg api method
         - return SendResult dto with message details
@@ -37,7 +41,7 @@ class MessageDispatcher:
             raise ChannelPostError(f"Unsupported message type: {contentType}")
         
         config = MESSAGE_TYPE_CONFIGS[contentType]
-        if not hasSpoiler and not overrideCaption and not replyMarkup and not message.forward_origin:
+        if allowCopy and not hasSpoiler and overrideCaption is None and not message.forward_origin:
             try:
                 copyParams = {
                     "chat_id": self.channelChatId,
@@ -48,6 +52,8 @@ class MessageDispatcher:
                     copyParams["reply_parameters"] = replyParams
                 if threadId:
                     copyParams["message_thread_id"] = threadId
+                if replyMarkup:
+                    copyParams["reply_markup"] = replyMarkup
                 result = await self.bot.copy_message(**copyParams)
                 logger.info(f"[DISPATCHER] successfully sent {contentType.name} (method: copy_message)")
                 return SendResult(
@@ -73,7 +79,8 @@ class MessageDispatcher:
         if threadId:
             params["message_thread_id"] = threadId
 
-        if replyMarkup and "from_chat_id" not in params:
+        # every send method and copy_message take reply_markup - no follow-up edit needed
+        if replyMarkup:
             params["reply_markup"] = replyMarkup
         if "text" in params and "from_chat_id" not in params:
             logger.info(f"[DISPATCHER] text override detected - using send_message")
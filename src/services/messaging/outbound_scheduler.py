@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Deque, Dict, Iterator, Optional
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from config import settings
+from common import LatencyTracker
+from services.rate_limiting.local_bucket import LocalTokenBucket
+
+logger = logging.getLogger(__name__)
+
+class Priority(IntEnum):
+    HIGH = 0   # channel posts
+    NORMAL = 1 # replies/confirmations to users
+    LOW = 2    # deferrable notifications
+
+_priorityOverride: ContextVar[Optional[Priority]] = ContextVar("outboundPriority", default=None)
+
+@contextmanager
+def withPriority(priority: Priority) -> Iterator[None]:
+    """every bot call made inside the block goes out on this lane"""
+    token = _priorityOverride.set(priority)
+    try:
+        yield
+    finally:
+        _priorityOverride.reset(token)
+
+# reads/acks and setup calls are not throttled - they don't count towards send limits
+EXEMPT_METHODS = frozenset({
+    "answerCallbackQuery",
+    "setWebhook",
+    "deleteWebhook",
+    "setMyCommands",
+    "sendChatAction",
+})
+
+# everything else (edits, deletes, pins) has its own per-chat budget, so it can't starve behind posts
+SEND_PREFIXES = ("send", "copy", "forward")
+
+@dataclass
+class _Waiter:
+    chatKey: str
+    future: asyncio.Future
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    central pacing for everything the bot sends - registered on bot.session,
+    so services keep calling bot.* directly
+
+    - one global token bucket (OUTBOUND_GLOBAL_RATE/s) + one per chat for sends
+      (private: OUTBOUND_CHAT_RATE/s, groups/channels: OUTBOUND_GROUP_RATE_PER_MINUTE)
+      and a separate one per chat for edits/deletes (OUTBOUND_EDIT_RATE/s)
+    - priority lanes: channel posts (HIGH) > user replies (NORMAL) > withPriority(LOW) work;
+      within a lane a chat that is out of budget doesn't hold up other chats
+    - callers only wait for a permit, the request itself runs concurrently
+    - TelegramRetryAfter -> the chat's bucket is blocked for retry_after and the call is
+      re-queued, up to OUTBOUND_MAX_RETRIES times (longer waits are raised to the caller)
+    - flood waits telegram applies to the whole bot show up as long retry-afters or as several
+      chats hitting one at once - then the global bucket is blocked too, so other chats don't
+      keep sending into the ban
+    """
+    def __init__(self, channelId: int = settings.CHANNEL_ID):
+        self.channelId = channelId
+        self.globalBucket = LocalTokenBucket(settings.OUTBOUND_GLOBAL_RATE, settings.OUTBOUND_GLOBAL_RATE)
+        self._chatBuckets: Dict[str, LocalTokenBucket] = {}
+        self._lanes: Dict[int, Deque[_Waiter]] = {priority: deque() for priority in Priority}
+        self._wakeup = asyncio.Event()
+        self._pump: asyncio.Task | None = None
+        self._recentRetryAfter: Deque[tuple[float, str]] = deque()
+        self.retries = 0
+        self.globalBlocks = 0
+        self.waitLatency = LatencyTracker("outbound_wait", reportEvery=500)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        apiMethod = method.__api_method__
+        if apiMethod.startswith("get") or apiMethod in EXEMPT_METHODS:
+            return await make_request(bot, method)
+
+        chatId = getattr(method, "chat_id", None)
+        chatKey = str(chatId)
+        if chatId is not None and not apiMethod.startswith(SEND_PREFIXES):
+            chatKey += ":edit"
+        priority = self._resolvePriority(chatId)
+        attempt = 0
+        while True:
+            await self._acquire(chatKey, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._getChatBucket(chatKey).block(e.retry_after)
+                self._checkGlobalFlood(str(chatId), e.retry_after)
+                attempt += 1
+                if attempt > settings.OUTBOUND_MAX_RETRIES or e.retry_after > settings.OUTBOUND_MAX_RETRY_AFTER_SECONDS:
+                    logger.warning(f"[OUTBOUND] {apiMethod} to {chatId} flood limited ({e.retry_after}s) - giving up")
+                    raise
+                self.retries += 1
+                logger.warning(
+                    f"[OUTBOUND] {apiMethod} to {chatId} hit retry-after {e.retry_after}s "
+                    f"(attempt {attempt}/{settings.OUTBOUND_MAX_RETRIES})"
+                )
+
+    def _checkGlobalFlood(self, chatKey: str, retryAfter: float) -> None:
+        now = time.monotonic()
+        recent = self._recentRetryAfter
+        recent.append((now, chatKey))
+        while recent and now - recent[0][0] > settings.OUTBOUND_GLOBAL_BLOCK_WINDOW_SECONDS:
+            recent.popleft()
+        chats = len({key for _, key in recent})
+        if retryAfter < settings.OUTBOUND_GLOBAL_BLOCK_RETRY_AFTER_SECONDS and chats < settings.OUTBOUND_GLOBAL_BLOCK_CHATS:
+            return
+        self.globalBucket.block(retryAfter)
+        self.globalBlocks += 1
+        logger.warning(f"[OUTBOUND] bot-wide flood wait suspected ({chats} chats, {retryAfter}s) - pausing all sends")
+
+    def _resolvePriority(self, chatId) -> Priority:
+        override = _priorityOverride.get()
+        if override is not None:
+            return override
+        if chatId == self.channelId:
+            return Priority.HIGH
+        return Priority.NORMAL
+
+    def _getChatBucket(self, chatKey: str) -> LocalTokenBucket:
+        bucket = self._chatBuckets.get(chatKey)
+        if bucket is None:
+            if chatKey == "None":
+                # no chat_id (inline message edits) - only the global budget applies
+                bucket = LocalTokenBucket(settings.OUTBOUND_GLOBAL_RATE, settings.OUTBOUND_GLOBAL_RATE)
+            elif chatKey.endswith(":edit"):
+                bucket = LocalTokenBucket(settings.OUTBOUND_EDIT_RATE, settings.OUTBOUND_EDIT_BURST)
+            elif chatKey.startswith("-") or chatKey.startswith("@"):
+                rate = settings.OUTBOUND_GROUP_RATE_PER_MINUTE / 60
+                bucket = LocalTokenBucket(rate, settings.OUTBOUND_GROUP_BURST)
+            else:
+                bucket = LocalTokenBucket(settings.OUTBOUND_CHAT_RATE, settings.OUTBOUND_CHAT_BURST)
+            self._chatBuckets[chatKey] = bucket
+        return bucket
+
+    async def _acquire(self, chatKey: str, priority: Priority) -> None:
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run(), name="outbound-scheduler")
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(chatKey, loop.create_future())
+        self._lanes[priority].append(waiter)
+        self._wakeup.set()
+        started = loop.time()
+        await waiter.future
+        self.waitLatency.record((loop.time() - started) * 1000)
+
+    def _nextReady(self) -> tuple[Optional[_Waiter], float]:
+        """highest priority waiter whose chat has budget; else the shortest wait among the rest"""
+        minWait = float("inf")
+        for priority in Priority:
+            lane = self._lanes[priority]
+            if any(waiter.future.done() for waiter in lane):
+                # callers that went away (cancelled) while queued
+                lane = self._lanes[priority] = deque(waiter for waiter in lane if not waiter.future.done())
+            for waiter in lane:
+                wait = self._getChatBucket(waiter.chatKey).waitTime()
+                if wait == 0:
+                    lane.remove(waiter)
+                    return waiter, 0.0
+                minWait = min(minWait, wait)
+        return None, minWait
+
+    async def _run(self) -> None:
+        while True:
+            if not any(self._lanes.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            globalWait = self.globalBucket.waitTime()
+            if globalWait > 0:
+                await asyncio.sleep(globalWait)
+                continue
+
+            waiter, wait = self._nextReady()
+            if waiter is None:
+                # every queued chat is out of budget - sleep until the first one refills or a new call comes in
+                self._wakeup.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=None if wait == float("inf") else wait)
+                continue
+
+            self.globalBucket.take()
+            self._getChatBucket(waiter.chatKey).take()
+            waiter.future.set_result(None)
+            self._evictIdleBuckets()
+
+    def _evictIdleBuckets(self) -> None:
+        if len(self._chatBuckets) <= settings.OUTBOUND_MAX_TRACKED_CHATS:
+            return
+        for chatKey in [key for key, bucket in self._chatBuckets.items() if bucket.idle]:
+            del self._chatBuckets[chatKey]
+
+    def stats(self) -> dict:
+        return {
+            "queued": {priority.name: len(self._lanes[priority]) for priority in Priority},
+            "trackedChats": len(self._chatBuckets),
+            "retries": self.retries,
+            "globalBlocks": self.globalBlocks,
+            "waitMs": self.waitLatency.summary(),
+        }
+
+    async def close(self) -> None:
+        if self._pump:
+            self._pump.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._pump
+            self._pump = None
@@ -1,2 +1,4 @@
+from .detection_pool import *
+from .verdict_cache import *
 from .nsfw_data_manager import *
 from .nsfw_checker import *
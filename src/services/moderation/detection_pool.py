@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from functools import partial
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, List
+import cv2
+import numpy as np
+from config import settings
+from common import LatencyTracker
+from exceptions import DetectionQueueFullError
+from services.moderation.frame_sampler import iterSampledFrames
+
+logger = logging.getLogger(__name__)
+
+# -- worker side :: one detector per process (shared by all threads in thread mode)
+# onnxruntime releases the GIL during session.run, so threads do run inference in parallel
+_detector = None
+_detectorLock = threading.Lock()
+
+def _getDetector():
+    global _detector
+    if _detector is None:
+        with _detectorLock:
+            if _detector is None:
+                from nudenet import NudeDetector
+                _detector = NudeDetector()
+    return _detector
+
+def _decodeImage(data: bytes | memoryview) -> np.ndarray:
+    """decode an encoded image straight from memory - no temp file"""
+    mat = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if mat is None:
+        raise ValueError("could not decode image buffer")
+    return mat
+
+def _prepareImage(image: Any) -> Any:
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return _decodeImage(image)
+    return image
+
+def _runDetection(image: Any) -> tuple[list, float]:
+    """image: path, ndarray or encoded bytes (decoded here, inside the worker)"""
+    started = time.perf_counter()
+    results = _getDetector().detect(_prepareImage(image))
+    return results, (time.perf_counter() - started) * 1000
+
+def _runDetectionBatch(images: list) -> tuple[list[list], float]:
+    """whole album in one onnx run (the model takes a dynamic batch dimension)"""
+    started = time.perf_counter()
+    prepared = [_prepareImage(image) for image in images]
+    results = _getDetector().detect_batch(prepared, batch_size=len(prepared))
+    return results, (time.perf_counter() - started) * 1000
+
+def _runVideoScan(
+    source: Any,
+    labels: frozenset,
+    threshold: float,
+    maxFrames: int,
+    batchSize: int,
+    budgetSeconds: float,
+) -> tuple[tuple[list, bool], float]:
+    """
+    samples keyframes and runs them through the detector in small batches
+    returns ((detections of all scanned frames, complete), ms)
+    - early stop as soon as a batch has a confident nsfw detection
+    - stops at the time budget so one long clip can't hold a worker; complete=False then
+    """
+    started = time.perf_counter()
+    deadline = started + budgetSeconds
+    detector = _getDetector()
+    detections, batch, complete = [], [], True
+
+    def flush() -> bool:
+        for frameResults in detector.detect_batch(batch, batch_size=len(batch)):
+            detections.extend(frameResults)
+        batch.clear()
+        return any(d['class'] in labels and d['score'] > threshold for d in detections)
+
+    for frame in iterSampledFrames(source, maxFrames, deadline):
+        batch.append(frame)
+        if len(batch) >= batchSize and flush():
+            return (detections, True), (time.perf_counter() - started) * 1000
+    if time.perf_counter() > deadline:
+        complete = False
+    if batch:
+        flush()
+    return (detections, complete), (time.perf_counter() - started) * 1000
+
+class DetectionPool:
+    """
+    runs NudeNet inference off the event loop
+    - NSFW_EXECUTOR=thread  : shared detector, threads (default, one model in memory)
+    - NSFW_EXECUTOR=process : one detector per worker process (spawned, model loaded in the worker)
+
+    at most NSFW_WORKERS inferences run at once and NSFW_QUEUE_SIZE more may wait;
+    a submission that can't get a slot within NSFW_QUEUE_TIMEOUT_SECONDS
+    raises DetectionQueueFullError instead of piling up behind the workers
+    """
+    def __init__(
+        self,
+        workers: int,
+        queueSize: int,
+        useProcesses: bool = False,
+        queueTimeout: float = 10.0,
+    ):
+        self.workers = workers
+        self.queueSize = queueSize
+        self.useProcesses = useProcesses
+        self.queueTimeout = queueTimeout
+        self._executor: Executor | None = None
+        self._slots = asyncio.Semaphore(workers + queueSize)
+        self.inferenceLatency = LatencyTracker("nsfw_inference", reportEvery=50)
+        self.batchLatency = LatencyTracker("nsfw_inference_batch", reportEvery=20)
+        self.videoLatency = LatencyTracker("nsfw_video_scan", reportEvery=20)
+        self.totalLatency = LatencyTracker("nsfw_detect_total", reportEvery=50)
+
+    @classmethod
+    def fromSettings(cls) -> "DetectionPool":
+        return cls(
+            workers=settings.NSFW_WORKERS,
+            queueSize=settings.NSFW_QUEUE_SIZE,
+            useProcesses=settings.NSFW_EXECUTOR == "process",
+            queueTimeout=settings.NSFW_QUEUE_TIMEOUT_SECONDS,
+        )
+
+    def _getExecutor(self) -> Executor:
+        if self._executor is None:
+            if self.useProcesses:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_getDetector,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="nsfw-detect",
+                    initializer=_getDetector,
+                )
+            logger.info(
+                f"[NSFW_POOL] started {'process' if self.useProcesses else 'thread'} pool "
+                f"(workers={self.workers}, queueSize={self.queueSize})"
+            )
+        return self._executor
+
+    def _toPicklable(self, image: Any) -> Any:
+        if self.useProcesses and isinstance(image, memoryview):
+            # buffers are shared as-is with threads, but have to be pickled for processes
+            return image.tobytes()
+        return image
+
+    async def _submit(self, fn, payload: Any, tracker: LatencyTracker) -> Any:
+        """one slot per submission - a batch counts as a single queued job"""
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queueTimeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[NSFW_POOL] no free slot after {self.queueTimeout}s - rejecting")
+            raise DetectionQueueFullError(self.workers + self.queueSize)
+        try:
+            loop = asyncio.get_running_loop()
+            results, inferenceMs = await loop.run_in_executor(self._getExecutor(), fn, payload)
+        finally:
+            self._slots.release()
+        totalMs = (time.perf_counter() - started) * 1000
+        tracker.record(inferenceMs)
+        self.totalLatency.record(totalMs)
+        logger.debug(f"[NSFW_POOL] inference {inferenceMs:.0f}ms (total incl. queue {totalMs:.0f}ms)")
+        return results
+
+    async def detect(self, image: Any) -> List[dict]:
+        return await self._submit(_runDetection, self._toPicklable(image), self.inferenceLatency)
+
+    async def detectBatch(self, images: List[Any]) -> List[List[dict]]:
+        """results in the same order as images"""
+        if not images:
+            return []
+        return await self._submit(
+            _runDetectionBatch,
+            [self._toPicklable(image) for image in images],
+            self.batchLatency
+        )
+
+    async def scanVideo(self, source: Any, labels: frozenset, threshold: float) -> tuple[list, bool]:
+        """(detections over the sampled frames, complete) - see _runVideoScan"""
+        return await self._submit(
+            partial(
+                _runVideoScan,
+                labels=labels,
+                threshold=threshold,
+                maxFrames=settings.NSFW_VIDEO_MAX_FRAMES,
+                batchSize=settings.NSFW_VIDEO_BATCH_SIZE,
+                budgetSeconds=settings.NSFW_VIDEO_TIME_BUDGET_SECONDS,
+            ),
+            self._toPicklable(source),
+            self.videoLatency
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
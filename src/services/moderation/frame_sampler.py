@@ -0,0 +1,53 @@
+import time
+from io import BytesIO
+from typing import Any, Iterator
+import av
+import numpy as np
+
+def _openContainer(source: Any) -> av.container.InputContainer:
+    """path -> opened directly | bytes/buffer -> streamed from memory"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    return av.open(source, mode="r")
+
+def iterSampledFrames(source: Any, maxFrames: int, deadline: float) -> Iterator[np.ndarray]:
+    """
+    yields up to maxFrames BGR frames spread evenly over the clip, decoding keyframes only
+    - known duration : seek to maxFrames evenly spaced points, decode just the keyframe at each
+    - unknown        : walk the keyframes from the start
+    stops once time.perf_counter() passes deadline
+    """
+    with _openContainer(source) as container:
+        stream = container.streams.video[0]
+        stream.codec_context.skip_frame = "NONKEY"
+        stream.thread_type = "AUTO"
+
+        duration = None
+        if stream.duration and stream.time_base:
+            duration = stream.duration
+        elif container.duration:
+            duration = int(container.duration / av.time_base / stream.time_base) if stream.time_base else None
+
+        if duration and maxFrames > 1:
+            lastPts = None
+            for idx in range(maxFrames):
+                if time.perf_counter() > deadline:
+                    return
+                target = (stream.start_time or 0) + duration * idx // maxFrames
+                container.seek(target, stream=stream, backward=True, any_frame=False)
+                frame = next(container.decode(stream), None)
+                if frame is None:
+                    continue
+                if frame.pts == lastPts:
+                    # short clip with fewer keyframes than samples - same keyframe again
+                    continue
+                lastPts = frame.pts
+                yield frame.to_ndarray(format="bgr24")
+            return
+
+        yielded = 0
+        for frame in container.decode(stream):
+            if yielded >= maxFrames or time.perf_counter() > deadline:
+                return
+            yielded += 1
+            yield frame.to_ndarray(format="bgr24")
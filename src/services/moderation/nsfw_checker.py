@@ -1,86 +1,182 @@
+import asyncio
 import logging
-from typing import Optional, Tuple
+from contextlib import asynccontextmanager
+from io import BytesIO
+from typing import AsyncIterator, List, Optional, Tuple
 from aiogram import Bot
 from aiogram.types import Message, PhotoSize
-from nudenet import NudeDetector
 from config import settings
+from exceptions import DetectionQueueFullError
+from services.moderation.detection_pool import DetectionPool
+from services.moderation.verdict_cache import NSFWVerdict, NSFWVerdictCache
 import os
 import tempfile
 
 logger = logging.getLogger(__name__)
 
+NSFW_LABELS = frozenset({'FEMALE_GENITALIA_EXPOSED', 'MALE_GENITALIA_EXPOSED', 
+                         'ANUS_EXPOSED', 'FEMALE_BREAST_EXPOSED', 'BUTTOCKS_EXPOSED'})
+
 class NSFWChecker:
     """
     check images/videos/gifs for nsfw content using nudenet
     this service is still under developement (enforced check is disabled), 
     as of now there are inits and basic image handling logic implemented
-    - TODO -- video censoring(might create cutom go module); handle stickers(YES STICKERS)
+    - TODO -- handle stickers(YES STICKERS)
     - might make it a small ml project
+
+    inference runs in a DetectionPool (thread/process workers), never on the event loop
+    photo verdicts are cached by file_unique_id - a re-sent photo is neither downloaded nor scanned again
     """
-    def __init__(self):
-        self.detector = None
-        self._initialized = False
+    def __init__(self, pool: Optional[DetectionPool] = None, verdictCache: Optional[NSFWVerdictCache] = None):
+        self.pool = pool or DetectionPool.fromSettings()
+        self.verdictCache = verdictCache or NSFWVerdictCache()
     
-    def _lazyInit(self):
-        if not self._initialized:
-            logger.info("initting nsfw detector...")
-            self.detector = NudeDetector()
-            self._initialized = True
-            logger.info("nsfw detector ready")
+    async def close(self) -> None:
+        self.pool.shutdown()
     
     async def checkMessage(self, bot: Bot, message: Message) -> Tuple[bool, Optional[str]]:
-        self._lazyInit()
         if message.photo:
             return await self._checkPhoto(bot, message.photo[-1])
         elif message.video:
-            return await self._checkVideo(bot, message.video.file_id)
+            return await self._checkVideo(bot, message.video.file_id, message.video.file_unique_id)
         elif message.animation:
-            return await self._checkVideo(bot, message.animation.file_id)        
+            return await self._checkVideo(bot, message.animation.file_id, message.animation.file_unique_id)        
         # text, stickers(FOR NOW), etc are assumed safe | # TODO -- check for stickers as well (if enforced and nsfw - dont send)
         return (True, None)
     
-    async def _checkPhoto(self, bot: Bot, photo: PhotoSize) -> Tuple[bool, Optional[str]]:
-        tempPath = None
+    @asynccontextmanager
+    async def _downloadMedia(self, bot: Bot, fileId: str, suffix: str) -> AsyncIterator[memoryview | str]:
+        """
+        yields the file contents as an in-memory buffer (no disk write);
+        only files above NSFW_MAX_INMEMORY_BYTES (large videos) go to a uniquely named temp file
+        """
+        file = await bot.get_file(fileId)
+        if (file.file_size or 0) <= settings.NSFW_MAX_INMEMORY_BYTES:
+            buffer = await bot.download_file(file.file_path, BytesIO())
+            yield buffer.getbuffer()
+            return
+
+        fd, tempPath = tempfile.mkstemp(prefix="nsfw_check_", suffix=suffix)
+        os.close(fd)
         try:
-            file = await bot.get_file(photo.file_id)
-            tempPath = os.path.join(tempfile.gettempdir(), f"nsfw_check_{photo.file_id}.jpg")
             await bot.download_file(file.file_path, tempPath)
-            results = self.detector.detect(tempPath)
-            NSFW_LABELS = ['FEMALE_GENITALIA_EXPOSED', 'MALE_GENITALIA_EXPOSED', 
-                          'ANUS_EXPOSED', 'FEMALE_BREAST_EXPOSED', 'BUTTOCKS_EXPOSED']
-            
-            for detection in results:
-                label = detection['class']
-                confidence = detection['score']
-                if label in NSFW_LABELS and confidence > settings.NSFW_DETECTION_THRESHOLD:
-                    logger.warning(f"nsfw content detected: {label} ({confidence:.2%})")
-                    return (False, f"nsfw content detected: {label.lower().replace('_', ' ')}")
+            yield tempPath
+        finally:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+    async def _downloadToMemory(self, bot: Bot, fileId: str) -> memoryview:
+        file = await bot.get_file(fileId)
+        buffer = await bot.download_file(file.file_path, BytesIO())
+        return buffer.getbuffer()
+
+    async def checkMediaItems(self, bot: Bot, items: List[dict]) -> List[Tuple[bool, Optional[str]]]:
+        """
+        verdict per album item (same order as items: {fileId, fileUniqueId, mediaType})
+        uncached photos are downloaded concurrently and scanned in ONE batched inference
+        """
+        verdicts: List[Tuple[bool, Optional[str]]] = [(True, None)] * len(items)
+        photoIdxs = [idx for idx, item in enumerate(items) if item.get('mediaType') == 'photo']
+        videoIdxs = [idx for idx, item in enumerate(items) if item.get('mediaType') in ('video', 'animation')]
+
+        cached = await asyncio.gather(*(
+            self.verdictCache.get(items[idx]['fileUniqueId']) for idx in photoIdxs
+        ))
+        pending = []
+        for idx, verdict in zip(photoIdxs, cached):
+            if verdict is None:
+                pending.append(idx)
+            else:
+                verdicts[idx] = self._verdictToResult(verdict)
+
+        if pending:
+            downloads = await asyncio.gather(
+                *(self._downloadToMemory(bot, items[idx]['fileId']) for idx in pending),
+                return_exceptions=True
+            )
+            scanIdxs, images = [], []
+            for idx, image in zip(pending, downloads):
+                if isinstance(image, Exception):
+                    logger.error(f"error downloading album item {items[idx]['fileId']} for nsfw check: {image}")
+                    continue
+                scanIdxs.append(idx)
+                images.append(image)
+            try:
+                results = await self.pool.detectBatch(images)
+                for idx, detections in zip(scanIdxs, results):
+                    verdict = self._buildVerdict(detections)
+                    await self.verdictCache.set(items[idx]['fileUniqueId'], verdict)
+                    verdicts[idx] = self._verdictToResult(verdict)
+            except DetectionQueueFullError as e:
+                logger.warning(f"skipping album nsfw check: {e.message}")
+            except Exception as e:
+                logger.error(f"error checking album for nsfw: {e}", exc_info=True)
+
+        if videoIdxs:
+            videoVerdicts = await asyncio.gather(*(
+                self._checkVideo(bot, items[idx]['fileId'], items[idx]['fileUniqueId']) for idx in videoIdxs
+            ))
+            for idx, verdict in zip(videoIdxs, videoVerdicts):
+                verdicts[idx] = verdict
+        return verdicts
+
+    @staticmethod
+    def _buildVerdict(results: list) -> NSFWVerdict:
+        """keep only the strongest nsfw detection, the decision is made against the threshold later"""
+        label, score = None, 0.0
+        for detection in results:
+            if detection['class'] in NSFW_LABELS and detection['score'] > score:
+                label, score = detection['class'], float(detection['score'])
+        return NSFWVerdict(label, score, settings.NSFW_DETECTION_THRESHOLD)
+
+    @staticmethod
+    def _verdictToResult(verdict: NSFWVerdict) -> Tuple[bool, Optional[str]]:
+        if verdict.isSafe(settings.NSFW_DETECTION_THRESHOLD):
             return (True, None)
+        logger.warning(f"nsfw content detected: {verdict.label} ({verdict.score:.2%})")
+        return (False, f"nsfw content detected: {verdict.label.lower().replace('_', ' ')}")
+
+    async def _checkPhoto(self, bot: Bot, photo: PhotoSize) -> Tuple[bool, Optional[str]]:
+        try:
+            verdict = await self.verdictCache.get(photo.file_unique_id)
+            if verdict is None:
+                async with self._downloadMedia(bot, photo.file_id, ".jpg") as image:
+                    results = await self.pool.detect(image)
+                verdict = self._buildVerdict(results)
+                await self.verdictCache.set(photo.file_unique_id, verdict)
+            return self._verdictToResult(verdict)
             
+        except DetectionQueueFullError as e:
+            # same fail-open policy as any other check error, just not worth a traceback
+            logger.warning(f"skipping nsfw check: {e.message}")
+            return (True, None)
         except Exception as e:
             logger.error(f"error checking photo for nsfw: {e}", exc_info=True)
             return (True, None)
-        finally:
-            if tempPath and os.path.exists(tempPath):
-                os.remove(tempPath)
     
-    async def _checkVideo(self, bot: Bot, file_id: str) -> Tuple[bool, Optional[str]]:
-        tempVideoPath = None
-        tempFramePath = None
+    async def _checkVideo(self, bot: Bot, fileId: str, fileUniqueId: str) -> Tuple[bool, Optional[str]]:
+        """
+        videos/animations: evenly spaced keyframes through the batched detector (see DetectionPool.scanVideo)
+        a scan cut short by the time budget is used but not cached, unless it already found nsfw
+        """
         try:
-            file = await bot.get_file(file_id)
-            tempVideoPath = os.path.join(tempfile.gettempdir(), f"nsfw_check_{file_id}.mp4")
-            await bot.download_file(file.file_path, tempVideoPath)
+            verdict = await self.verdictCache.get(fileUniqueId)
+            if verdict is None:
+                async with self._downloadMedia(bot, fileId, ".mp4") as video:
+                    detections, complete = await self.pool.scanVideo(
+                        video, NSFW_LABELS, settings.NSFW_DETECTION_THRESHOLD
+                    )
+                verdict = self._buildVerdict(detections)
+                if complete or not verdict.isSafe(settings.NSFW_DETECTION_THRESHOLD):
+                    await self.verdictCache.set(fileUniqueId, verdict)
+                else:
+                    logger.info(f"video {fileUniqueId} only partially scanned (time budget hit)")
+            return self._verdictToResult(verdict)
             
-            # TODO -- work on frame by frame nsfw check; for now disabled enforced check
-            logger.info("video nsfw check skipped (not implemented)")
+        except DetectionQueueFullError as e:
+            logger.warning(f"skipping video nsfw check: {e.message}")
             return (True, None)
-            
         except Exception as e:
             logger.error(f"error checking video for nsfw: {e}", exc_info=True)
             return (True, None)
-        finally:
-            if tempVideoPath and os.path.exists(tempVideoPath):
-                os.remove(tempVideoPath)
-            if tempFramePath and os.path.exists(tempFramePath):
-                os.remove(tempFramePath)
@@ -0,0 +1,45 @@
+import json
+from typing import NamedTuple, Optional
+from redis.asyncio import Redis
+from config import settings
+from common import TwoTierCache
+
+class NSFWVerdict(NamedTuple):
+    """
+    strongest nsfw detection for a file (label None / score 0 when nothing was found)
+    threshold is the one in force when the file was scanned - the decision itself is
+    re-derived from the score, so changing NSFW_DETECTION_THRESHOLD doesn't need a cache flush
+    """
+    label: Optional[str]
+    score: float
+    threshold: float
+
+    def isSafe(self, threshold: float) -> bool:
+        return self.label is None or self.score <= threshold
+
+class NSFWVerdictCache:
+    """
+    verdicts keyed by telegram file_unique_id (stable across re-sends and bots)
+    in-process LRU -> redis (nsfw_verdict:{file_unique_id}, TTL) -> miss
+    a hit skips both the download and the inference
+    """
+    def __init__(self, redis: Optional[Redis] = None):
+        ttl = settings.NSFW_VERDICT_CACHE_TTL_SECONDS
+        self.cache = TwoTierCache[NSFWVerdict](
+            "NSFW_CACHE", redis, "nsfw_verdict",
+            lambda verdict: json.dumps(verdict._asdict()),
+            lambda raw: NSFWVerdict(**json.loads(raw)),
+            ttl=ttl,
+            localSize=settings.NSFW_VERDICT_CACHE_SIZE,
+            localTtl=ttl,
+            reportEvery=settings.NSFW_VERDICT_CACHE_REPORT_EVERY,
+        )
+
+    async def get(self, fileUniqueId: str) -> Optional[NSFWVerdict]:
+        return await self.cache.get(fileUniqueId)
+
+    async def set(self, fileUniqueId: str, verdict: NSFWVerdict) -> None:
+        await self.cache.set(fileUniqueId, verdict)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
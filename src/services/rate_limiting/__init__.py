@@ -1 +1,3 @@
 from .rate_limiter import *
+from .token_bucket import *
+from .local_bucket import *
@@ -0,0 +1,40 @@
+import time
+
+class LocalTokenBucket:
+    """
+    in-process token bucket (no redis) - used to pace our own outbound calls
+    rate = tokens per second, capacity = burst
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updatedAt = time.monotonic()
+        self.blockedUntil = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+
+    def waitTime(self) -> float:
+        """seconds until a token is available (0 = now)"""
+        now = time.monotonic()
+        if now < self.blockedUntil:
+            return self.blockedUntil - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """server told us to back off (Retry-After) - nothing goes out before that"""
+        self.blockedUntil = max(self.blockedUntil, time.monotonic() + seconds)
+        self.tokens = 0
+
+    @property
+    def idle(self) -> bool:
+        return self.waitTime() == 0 and self.tokens >= self.capacity
@@ -1,50 +1,108 @@
 import time
+import uuid
+from typing import NamedTuple, Optional
 from redis.asyncio import Redis
 from config import settings
 from exceptions import RateLimitExceeded
 
+# -- check + record in one server-side round trip
+# KEYS[1] = per-user zset | ARGV = windowMs, limit, member
+# member already present (album sibling) -> allowed without being charged again
+# returns {allowed, retryAfterMs, count, charged}
+# uses redis TIME so replicas with skewed clocks agree on the window
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local member = ARGV[3]
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if redis.call('ZSCORE', key, member) then
+    return {1, 0, count, 0}
+end
+if count >= limit then
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    local retryAfter = window
+    if oldest[2] then
+        retryAfter = tonumber(oldest[2]) + window - now
+    end
+    return {0, retryAfter, count, 0}
+end
+redis.call('ZADD', key, now, member)
+redis.call('PEXPIRE', key, window + 60000)
+return {1, 0, count + 1, 1}
+"""
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    retryAfter: int # in sec, 0 when allowed
+    count: int
+    charged: bool = False # this call took from the budget (refundable)
+    member: Optional[str] = None
+
 class RateLimiterService:
-    def __init__(self, redis: Redis):
+    """
+    sliding window limiter - a single lua script atomically trims the window,
+    checks the count and records the message, so concurrent messages from one
+    user can no longer both slip through between check and record
+
+    album items share one zset member per media_group_id -> an album costs one message
+    """
+    def __init__(self, redis: Redis, limit: Optional[int] = None, window: Optional[int] = None):
         self.redis = redis
-        self.limit = settings.RATE_LIMIT_MESSAGES
-        self.window = settings.RATE_LIMIT_WINDOW_SECONDS
-    
+        self.limit = limit or settings.RATE_LIMIT_MESSAGES
+        self.window = window or settings.RATE_LIMIT_WINDOW_SECONDS
+        self._script = redis.register_script(SLIDING_WINDOW_SCRIPT)
+
     def _getKey(self, userId: int) -> str:
         return f"ratelimit:{userId}:messages"
-    
-    async def checkRateLimit(self, userId: int) -> None:
-        key = self._getKey(userId)
-        currentTime = int(time.time())
-        windowStart = currentTime - self.window
-        
-        await self.redis.zremrangebyscore(key, 0, windowStart)
-        count = await self.redis.zcard(key)
-        
-        if count >= self.limit:
-            oldest = await self.redis.zrange(key, 0, 0, withscores=True)
-            if oldest:
-                oldestTime = int(oldest[0][1])
-                retryAfter = oldestTime + self.window - currentTime
-                raise RateLimitExceeded(
-                    retryAfter=max(1, retryAfter),
-                    currentMessageCount=count,
-                    limit=self.limit
-                )
-    
-    async def recordMessage(self, userId: int) -> None:
-        key = self._getKey(userId)
-        currentTime = time.time()
-        await self.redis.zadd(key, {str(currentTime): currentTime})
-        await self.redis.expire(key, self.window + 60)
-    
+
+    @staticmethod
+    def _getMember(groupId: Optional[str]) -> str:
+        if groupId:
+            return f"mg:{groupId}"
+        return f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+
+    async def acquire(self, userId: int, groupId: Optional[str] = None) -> RateLimitResult:
+        member = self._getMember(groupId)
+        allowed, retryAfterMs, count, charged = await self._script(
+            keys=[self._getKey(userId)],
+            args=[self.window * 1000, self.limit, member]
+        )
+        return RateLimitResult(
+            allowed=bool(allowed),
+            retryAfter=max(1, -(-int(retryAfterMs) // 1000)) if not allowed else 0,
+            count=int(count),
+            charged=bool(charged),
+            member=member
+        )
+
+    async def refund(self, userId: int, result: RateLimitResult) -> None:
+        """give back a charge for a message that was rejected by a later guard"""
+        if result.charged:
+            await self.redis.zrem(self._getKey(userId), result.member)
+
+    async def checkRateLimit(self, userId: int, groupId: Optional[str] = None) -> None:
+        """check and record in one go; raises RateLimitExceeded when denied"""
+        self.ensureAllowed(await self.acquire(userId, groupId))
+
+    def ensureAllowed(self, result: RateLimitResult) -> None:
+        if not result.allowed:
+            raise RateLimitExceeded(
+                retryAfter=result.retryAfter,
+                currentMessageCount=result.count,
+                limit=self.limit
+            )
+
     async def getMessageCount(self, userId: int) -> int:
         key = self._getKey(userId)
-        currentTime = int(time.time())
-        windowStart = currentTime - self.window
+        windowStart = int(time.time() * 1000) - self.window * 1000
         await self.redis.zremrangebyscore(key, 0, windowStart)
         return await self.redis.zcard(key)
-    
+
     async def resetUserLimit(self, userId: int) -> None:
         key = self._getKey(userId)
         await self.redis.delete(key)
-        
\ No newline at end of file
@@ -0,0 +1,122 @@
+from typing import Optional
+from redis.asyncio import Redis
+from config import settings
+from exceptions import RateLimitExceeded
+from services.rate_limiting.rate_limiter import RateLimitResult, RateLimiterService
+
+# KEYS[1] = per-user bucket hash | KEYS[2] (optional) = album marker
+# ARGV = capacity, refill tokens per ms, ttlMs
+# returns {allowed, retryAfterMs, tokensLeft, charged}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+if KEYS[2] and redis.call('EXISTS', KEYS[2]) == 1 then
+    return {1, 0, -1, 0}
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+if tokens < 1 then
+    return {0, math.ceil((1 - tokens) / rate), 0, 0}
+end
+tokens = tokens - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ttl)
+if KEYS[2] then
+    redis.call('SET', KEYS[2], '1', 'PX', ttl)
+end
+return {1, 0, math.floor(tokens), 1}
+"""
+
+# KEYS[1] = per-user bucket hash | KEYS[2] (optional) = album marker | ARGV = capacity
+REFUND_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[1]), tokens + 1)))
+end
+if KEYS[2] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+class TokenBucketRateLimiter:
+    """
+    token bucket variant - same average rate as the sliding window
+    (RATE_LIMIT_MESSAGES per RATE_LIMIT_WINDOW_SECONDS) but lets a user burst
+    up to RATE_LIMIT_BURST posts at once, then refills continuously instead of
+    waiting for the oldest entry to fall out of the window
+
+    album items are charged once per media_group_id (marker key), same as the sliding window
+    drop-in for RateLimiterService (RATE_LIMIT_STRATEGY=token_bucket)
+    """
+    def __init__(
+        self,
+        redis: Redis,
+        limit: Optional[int] = None,
+        window: Optional[int] = None,
+        burst: Optional[int] = None,
+    ):
+        self.redis = redis
+        self.limit = limit or settings.RATE_LIMIT_MESSAGES
+        self.window = window or settings.RATE_LIMIT_WINDOW_SECONDS
+        self.capacity = burst or settings.RATE_LIMIT_BURST
+        self.refillPerMs = self.limit / (self.window * 1000)
+        self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self._refundScript = redis.register_script(REFUND_SCRIPT)
+
+    def _getKey(self, userId: int) -> str:
+        return f"ratelimit:{userId}:bucket"
+
+    def _getGroupKey(self, userId: int, groupId: str) -> str:
+        return f"ratelimit:{userId}:group:{groupId}"
+
+    async def acquire(self, userId: int, groupId: Optional[str] = None) -> RateLimitResult:
+        keys = [self._getKey(userId)]
+        if groupId:
+            keys.append(self._getGroupKey(userId, groupId))
+        allowed, retryAfterMs, tokensLeft, charged = await self._script(
+            keys=keys,
+            args=[self.capacity, self.refillPerMs, self.window * 1000 + 60000]
+        )
+        return RateLimitResult(
+            allowed=bool(allowed),
+            retryAfter=max(1, -(-int(retryAfterMs) // 1000)) if not allowed else 0,
+            count=self.capacity - max(0, int(tokensLeft)) if tokensLeft >= 0 else 0,
+            charged=bool(charged),
+            member=keys[1] if groupId else None
+        )
+
+    async def refund(self, userId: int, result: RateLimitResult) -> None:
+        """give back a charge for a message that was rejected by a later guard"""
+        if not result.charged:
+            return
+        keys = [self._getKey(userId)]
+        if result.member:
+            keys.append(result.member)
+        await self._refundScript(keys=keys, args=[self.capacity])
+
+    async def checkRateLimit(self, userId: int, groupId: Optional[str] = None) -> None:
+        self.ensureAllowed(await self.acquire(userId, groupId))
+
+    def ensureAllowed(self, result: RateLimitResult) -> None:
+        if not result.allowed:
+            raise RateLimitExceeded(
+                retryAfter=result.retryAfter,
+                currentMessageCount=result.count,
+                limit=self.capacity
+            )
+
+    async def resetUserLimit(self, userId: int) -> None:
+        await self.redis.delete(self._getKey(userId))
+
+def createRateLimiter(redis: Redis) -> RateLimiterService | TokenBucketRateLimiter:
+    if settings.RATE_LIMIT_STRATEGY == "token_bucket":
+        return TokenBucketRateLimiter(redis)
+    return RateLimiterService(redis)
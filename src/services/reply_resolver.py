@@ -55,7 +55,7 @@ class ReplyResolverService:
         link = TelegramLinkParser.extractLinkFromText(text)
         if link:
             logger.info(f"[RESOLVE] found link in text: {link}")
-            return await self._resolveLink(link)
+            return await self.resolveLink(link)
 
         logger.info(f"[RESOLVE] no reply found for message {message.message_id}")
         return None
@@ -100,7 +100,7 @@ class ReplyResolverService:
             f"[DIRECT] trying mapping for user message: "
             f"chatId={replyToMessage.chat.id}, messageId={replyToMessage.message_id}"
         )
-        mapping = await self.messageMappingRepo.getByUserMessageOrLastEditMessage(
+        mapping = await self.messageMappingRepo.resolveChannelMessage(
             userChatId=replyToMessage.chat.id,
             userMessageId=replyToMessage.message_id
         )
@@ -132,7 +132,8 @@ class ReplyResolverService:
         logger.info(f"[DIRECT] no forward origin either -> returning None")
         return None
 
-    async def _resolveLink(self, text: str) -> Optional[ReplyParameters]:
+    async def resolveLink(self, text: str) -> Optional[ReplyParameters]:
+        """reply params from a channel/comment message link found in text"""
         link = TelegramLinkParser.extractLinkFromText(text)
         if link:
             parsed = TelegramLinkParser.parseMessageLink(link)
@@ -1,15 +1,41 @@
+from typing import Optional
 from aiogram import Bot
 from aiogram.enums import ChatMemberStatus
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from redis.asyncio import Redis
 from common import SUBSCRIBED_STATUSES
+from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SubscriptionCheckerService:
-    def __init__(self, bot: Bot, channelId: int):
+    """
+    membership checks against the channel with a redis status cache in front of get_chat_member
+    - subscribed/left/kicked get separate TTLs (negative results expire sooner)
+    - 'unknown' is never cached
+    - chat_member updates write the fresh status straight into the cache (see handlers/membership.py)
+    """
+    def __init__(self, bot: Bot, channelId: int, redis: Optional[Redis] = None):
         self.bot = bot
         self.channelId = channelId
+        self.redis = redis
+        self.ttls = {
+            "subscribed": settings.SUBSCRIPTION_CACHE_TTL_SUBSCRIBED,
+            "left": settings.SUBSCRIPTION_CACHE_TTL_LEFT,
+            "kicked": settings.SUBSCRIPTION_CACHE_TTL_KICKED,
+        }
+
+    def _getKey(self, telegramId: int) -> str:
+        return f"sub_status:{telegramId}"
+
+    @staticmethod
+    def statusFromMember(memberStatus: ChatMemberStatus) -> str:
+        if memberStatus in SUBSCRIBED_STATUSES:
+            return "subscribed"
+        if memberStatus == ChatMemberStatus.KICKED:
+            return "kicked"
+        return "left"
 
     async def getStatus(self, telegramId: int) -> str:
         """
@@ -19,16 +45,20 @@ class SubscriptionCheckerService:
         'kicked'     - banned from the channel
         'unknown'    - check failed (bot likely missing admin rights); callers should fail open
         """
+        cached = await self._getCached(telegramId)
+        if cached:
+            return cached
+        status = await self._fetchStatus(telegramId)
+        await self.cacheStatus(telegramId, status)
+        return status
+
+    async def _fetchStatus(self, telegramId: int) -> str:
         try:
             member = await self.bot.get_chat_member(
                 chat_id=self.channelId,
                 user_id=telegramId
             )
-            if member.status in SUBSCRIBED_STATUSES:
-                return "subscribed"
-            if member.status == ChatMemberStatus.KICKED:
-                return "kicked"
-            return "left"
+            return self.statusFromMember(member.status)
         except TelegramBadRequest as e:
             logger.warning(f"[SUB_CHECK] bad request for user {telegramId}: {e}")
             return "left"
@@ -42,6 +72,32 @@ class SubscriptionCheckerService:
             logger.error(f"[SUB_CHECK] unexpected error for user {telegramId}: {e}", exc_info=True)
             return "unknown"
 
+    async def _getCached(self, telegramId: int) -> Optional[str]:
+        if not self.redis:
+            return None
+        try:
+            return await self.redis.get(self._getKey(telegramId))
+        except Exception as e:
+            logger.warning(f"[SUB_CACHE] read failed for user {telegramId}: {e}")
+            return None
+
+    async def cacheStatus(self, telegramId: int, status: str) -> None:
+        """store status with its own TTL; statuses without a TTL ('unknown') drop the entry instead"""
+        if not self.redis:
+            return
+        ttl = self.ttls.get(status)
+        try:
+            if ttl:
+                await self.redis.setex(self._getKey(telegramId), ttl, status)
+            else:
+                await self.redis.delete(self._getKey(telegramId))
+        except Exception as e:
+            logger.warning(f"[SUB_CACHE] write failed for user {telegramId}: {e}")
+
+    async def invalidate(self, telegramId: int) -> None:
+        if self.redis:
+            await self.redis.delete(self._getKey(telegramId))
+
     async def isSubscribed(self, telegramId: int) -> tuple[bool, str]:
         """
         returns: (is_subscribed, status). 
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from contextlib import suppress
+from datetime import datetime
+from typing import Dict
+from sqlalchemy import update
+from config import settings, dbManager
+from db import User
+
+logger = logging.getLogger(__name__)
+
+class UserActivityTracker:
+    """
+    debounced lastActiveAt writer (singleton on dp)
+    touch() only records the latest timestamp in memory; every USER_ACTIVITY_FLUSH_SECONDS
+    all touched users are written in one batched UPDATE by primary key on its own session,
+    so a chatty user costs one row write per interval instead of one per message
+    close() flushes whatever is left
+    """
+    def __init__(self, flushInterval: float = settings.USER_ACTIVITY_FLUSH_SECONDS):
+        self.flushInterval = flushInterval
+        self._pending: Dict[int, datetime] = {}
+        self._task: asyncio.Task | None = None
+        self.flushed = 0
+
+    def touch(self, userId: int) -> None:
+        self._pending[userId] = datetime.now()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="user-activity-flusher")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flushInterval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            async with dbManager.session() as session:
+                await session.execute(
+                    update(User),
+                    [{"id": userId, "lastActiveAt": seenAt} for userId, seenAt in batch.items()]
+                )
+            self.flushed += len(batch)
+            logger.debug(f"[USER_ACTIVITY] flushed lastActiveAt for {len(batch)} users")
+        except Exception as e:
+            # keep the newer timestamps that arrived meanwhile, retry the rest next round
+            for userId, seenAt in batch.items():
+                self._pending.setdefault(userId, seenAt)
+            logger.warning(f"[USER_ACTIVITY] flush of {len(batch)} users failed: {e}")
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "flushed": self.flushed}
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,43 @@
+import json
+from typing import Optional
+from redis.asyncio import Redis
+from config import settings
+from common import TwoTierCache
+from db import UserSnapshot
+
+class UserSnapshotCache:
+    """
+    telegramId -> UserSnapshot for hot-path ban/admin/alias checks (singleton on dp)
+    in-process LRU -> redis (user_snapshot:{telegramId}) -> DB
+
+    UserRepository reads through it (getSnapshot / ensureUser) and drops the entry after
+    ban, unban, setAlias and clearAlias commit. isBanned/isAdmin are normally flipped
+    directly in the DB, which nothing here sees - hence entries live only seconds
+    (USER_SNAPSHOT_TTL_SECONDS in redis, USER_SNAPSHOT_LOCAL_TTL_SECONDS in each replica's LRU).
+    to apply such a change sooner: DEL user_snapshot:<telegramId> in redis; replicas follow
+    once their LRU entry expires
+    """
+    def __init__(self, redis: Optional[Redis] = None):
+        self.cache = TwoTierCache[UserSnapshot](
+            "USER_SNAPSHOT", redis, "user_snapshot",
+            lambda snapshot: json.dumps(snapshot._asdict()),
+            lambda raw: UserSnapshot(**json.loads(raw)),
+            ttl=settings.USER_SNAPSHOT_TTL_SECONDS,
+            localSize=settings.USER_SNAPSHOT_CACHE_SIZE,
+            localTtl=settings.USER_SNAPSHOT_LOCAL_TTL_SECONDS,
+        )
+
+    async def get(self, telegramId: int) -> Optional[UserSnapshot]:
+        return await self.cache.get(telegramId)
+
+    async def set(self, snapshot: UserSnapshot) -> None:
+        await self.cache.set(snapshot.telegramId, snapshot)
+
+    async def fill(self, snapshot: UserSnapshot) -> None:
+        await self.cache.fill(snapshot.telegramId, snapshot)
+
+    async def invalidate(self, telegramId: int) -> None:
+        await self.cache.invalidate([telegramId])
+
+    def stats(self) -> dict:
+        return self.cache.stats()
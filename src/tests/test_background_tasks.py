@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+from unittest import mock
+from config import settings
+from services.background_tasks import BackgroundTaskSupervisor
+from services.messaging.confirmation_service import ConfirmationService
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+class BackgroundTaskSupervisorTests(unittest.IsolatedAsyncioTestCase):
+    async def testDrainWaitsForFollowUpWork(self):
+        supervisor = BackgroundTaskSupervisor(10)
+        ran = []
+        async def followUp():
+            await asyncio.sleep(0.05)
+            ran.append("followUp")
+        async def album():
+            await asyncio.sleep(0.05)
+            supervisor.spawn(followUp(), name="confirm-1")
+        supervisor.spawn(album(), name="media-group-1")
+        await supervisor.drain(1)
+        self.assertEqual(ran, ["followUp"])
+        # new work from outside is refused once draining
+        async def late():
+            pass
+        self.assertIsNone(supervisor.spawn(late(), name="late"))
+
+    async def testDrainTimeoutLogsCancelledTaskNames(self):
+        supervisor = BackgroundTaskSupervisor(10)
+        supervisor.spawn(asyncio.sleep(60), name="stuck-task")
+        with self.assertLogs("services.background_tasks", level="WARNING") as logs:
+            await supervisor.drain(0.05)
+        self.assertIn("stuck-task", "\n".join(logs.output))
+        self.assertEqual(supervisor.active, 0)
+
+    async def testConfirmationFlushBeatsCoalesceDelay(self):
+        supervisor = BackgroundTaskSupervisor(10)
+        bot = FakeBot()
+        confirmations = ConfirmationService(bot, None, supervisor)
+        with mock.patch.object(settings, "CONFIRMATION_COALESCE_SECONDS", 60):
+            confirmations.confirm(1, userMessageId=10, channelMessageId=20)
+            confirmations.confirm(1, userMessageId=11, channelMessageId=21)
+            confirmations.flush()
+            await supervisor.drain(1)
+        self.assertEqual(len(bot.sent), 1)
+        self.assertIn("2 messages", bot.sent[0][1])
@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from unittest import mock
+import fakeredis.aioredis
+from common import TOMBSTONE
+from db import ChannelMessageRef, MessageMappingRepository
+from services.mapping_cache import MappingCache
+
+KEY = (111, 5)
+REF = ChannelMessageRef(-1001, 77)
+
+class MappingCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.cache = MappingCache(self.redis)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def testFillOnMissIsShared(self):
+        await self.cache.fill(*KEY, REF)
+        self.assertEqual(await self.cache.get(*KEY), REF)
+        self.assertEqual(await MappingCache(self.redis).get(*KEY), REF)
+
+    async def testInvalidateThenStaleFill(self):
+        # reader misses and reads the row, a delete commits and invalidates, then the reader fills
+        self.assertIsNone(await self.cache.get(*KEY))
+        await self.cache.invalidate([KEY])
+        await self.cache.fill(*KEY, REF)
+        self.assertIsNone(await self.cache.get(*KEY))
+        self.assertIsNone(await MappingCache(self.redis).get(*KEY))
+        self.assertEqual(self.cache.stats()["skippedFills"], 1)
+
+    async def testStaleFillFromAnotherReplica(self):
+        other = MappingCache(self.redis)
+        await self.cache.invalidate([KEY])
+        await other.fill(*KEY, REF)
+        self.assertIsNone(await other.get(*KEY))
+
+    async def testStaleFillWithoutRedis(self):
+        cache = MappingCache()
+        await cache.invalidate([KEY])
+        await cache.fill(*KEY, REF)
+        self.assertIsNone(await cache.get(*KEY))
+
+    async def testSetOverridesTombstone(self):
+        await self.cache.invalidate([KEY])
+        await self.cache.set(*KEY, REF)
+        self.assertEqual(await self.cache.get(*KEY), REF)
+        self.assertEqual(await MappingCache(self.redis).get(*KEY), REF)
+
+    async def testResolveDoesNotRecacheDeletedMapping(self):
+        """resolveChannelMessage reads the row, markAsDeletedBulk's invalidation lands before its fill"""
+        readDone, invalidated = asyncio.Event(), asyncio.Event()
+        repo = MessageMappingRepository(mock.Mock(), self.cache)
+
+        async def slowRead(userChatId, userMessageId):
+            readDone.set()
+            await invalidated.wait()
+            return mock.Mock(channelChatId=REF.channelChatId, channelMessageId=REF.channelMessageId)
+
+        with mock.patch.object(repo, "getByUserMessageOrLastEditMessage", slowRead):
+            resolving = asyncio.create_task(repo.resolveChannelMessage(*KEY))
+            await readDone.wait()
+            await self.cache.invalidate([KEY])
+            invalidated.set()
+            self.assertEqual(await resolving, REF)
+
+        self.assertIsNone(await self.cache.get(*KEY))
+        # the tombstone is still what redis holds for the key
+        self.assertEqual(await self.redis.get("mapping:111:5"), TOMBSTONE)
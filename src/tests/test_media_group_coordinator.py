@@ -0,0 +1,137 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from unittest import mock
+import fakeredis.aioredis
+from config import settings
+from services.background_tasks import BackgroundTaskSupervisor
+from services.media import media_group_coordinator
+from services.media.media_group_coordinator import MediaGroupCoordinator, PENDING_KEY
+
+GROUP_ID = "album-1"
+
+# short timings so albums flush within the test; the lease outlives a sweep interval several times
+FAST_SETTINGS = {
+    "MEDIA_GROUP_IDLE_MIN_MS": 50,
+    "MEDIA_GROUP_IDLE_MAX_MS": 100,
+    "MEDIA_GROUP_MAX_WAIT_SECONDS": 0.3,
+    "MEDIA_GROUP_LEASE_MS": 200,
+    "MEDIA_GROUP_SWEEP_INTERVAL_SECONDS": 0.05,
+}
+
+class RecordingHandler:
+    """stands in for MediaGroupHandler - records what the coordinator flushed"""
+    flushed = []
+
+    def __init__(self, *args):
+        pass
+
+    async def processGroup(self, groupId: str, bufferData: dict) -> None:
+        self.flushed.append((groupId, bufferData))
+
+@asynccontextmanager
+async def fakeSession():
+    yield None
+
+def item(messageId: int) -> dict:
+    return {"messageId": messageId, "chatId": 1, "userId": 7}
+
+class MediaGroupCoordinatorTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        for name, value in FAST_SETTINGS.items():
+            patcher = mock.patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name, value in (("MediaGroupHandler", RecordingHandler), ("dbManager", mock.Mock(session=fakeSession))):
+            patcher = mock.patch.object(media_group_coordinator, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        RecordingHandler.flushed = []
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.supervisor = BackgroundTaskSupervisor(10)
+
+    async def asyncTearDown(self):
+        await self.supervisor.drain(timeout=1)
+        await self.redis.aclose()
+
+    def replica(self, supervisor: BackgroundTaskSupervisor | None = None) -> MediaGroupCoordinator:
+        coordinator = MediaGroupCoordinator(
+            None, self.redis, None, supervisor or self.supervisor, None, None
+        )
+        self.addAsyncCleanup(coordinator.close)
+        return coordinator
+
+    async def waitForFlush(self, timeout: float = 2) -> None:
+        async def poll():
+            while not RecordingHandler.flushed:
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(poll(), timeout)
+
+    async def testFlushesOnceAcrossReplicas(self):
+        first, second = self.replica(), self.replica()
+        await first.push(GROUP_ID, item(1), meta={"userId": 7, "replyToMessageId": 99})
+        await second.push(GROUP_ID, item(2), meta={"userId": 7, "replyToMessageId": 1})
+        await first.push(GROUP_ID, item(3))
+        await self.waitForFlush()
+        await asyncio.sleep(0.2)
+
+        self.assertEqual(len(RecordingHandler.flushed), 1)
+        groupId, bufferData = RecordingHandler.flushed[0]
+        self.assertEqual(groupId, GROUP_ID)
+        self.assertEqual([i["messageId"] for i in bufferData["messageIds"]], [1, 2, 3])
+        # the first pushed meta wins
+        self.assertEqual(bufferData["replyToMessageId"], 99)
+        self.assertEqual(await self.redis.zcard(PENDING_KEY), 0)
+
+    async def testLateItemRefused(self):
+        coordinator = self.replica()
+        self.assertEqual(await coordinator.push(GROUP_ID, item(1)), 1)
+        await self.waitForFlush()
+        self.assertIsNone(await coordinator.push(GROUP_ID, item(2)))
+        self.assertEqual(await self.redis.llen(f"media_group:{GROUP_ID}"), 0)
+
+    async def testFullAlbumFlushesImmediately(self):
+        coordinator = self.replica()
+        with mock.patch.object(settings, "MEDIA_GROUP_MAX_ITEMS", 2), \
+                mock.patch.object(settings, "MEDIA_GROUP_IDLE_MIN_MS", 5000), \
+                mock.patch.object(settings, "MEDIA_GROUP_IDLE_MAX_MS", 5000), \
+                mock.patch.object(settings, "MEDIA_GROUP_MAX_WAIT_SECONDS", 10):
+            await coordinator.push(GROUP_ID, item(1))
+            await coordinator.push(GROUP_ID, item(2))
+            await self.waitForFlush(timeout=1)
+        self.assertEqual(len(RecordingHandler.flushed[0][1]["messageIds"]), 2)
+
+    async def testLostLeaseStopsCoordinator(self):
+        coordinator = self.replica()
+        await coordinator.push(GROUP_ID, item(1))
+        # another replica grabbed the lease (e.g. ours stalled past expiry)
+        await self.redis.set(f"media_group_lease:{GROUP_ID}", "someone-else", px=5000)
+        await asyncio.sleep(0.5)
+        self.assertEqual(RecordingHandler.flushed, [])
+        self.assertNotIn(GROUP_ID, coordinator._groups)
+        self.assertEqual(await self.redis.llen(f"media_group:{GROUP_ID}"), 1)
+
+    async def testSweeperTakesOverOrphanedGroup(self):
+        # the first replica wins the lease but dies before coordinating (spawn refused)
+        deadSupervisor = BackgroundTaskSupervisor(1)
+        await deadSupervisor.drain(timeout=0)
+        dead = self.replica(deadSupervisor)
+        await dead.push(GROUP_ID, item(1), meta={"userId": 7})
+        self.assertEqual(await self.redis.get(f"media_group_lease:{GROUP_ID}"), dead.token)
+
+        survivor = self.replica()
+        survivor.start()
+        await self.waitForFlush()
+        self.assertEqual([i["messageId"] for i in RecordingHandler.flushed[0][1]["messageIds"]], [1])
+        self.assertEqual(await self.redis.zcard(PENDING_KEY), 0)
+
+    async def testSweeperLeavesLiveLeaseAlone(self):
+        owner = self.replica()
+        await self.redis.set(f"media_group_lease:{GROUP_ID}", owner.token, px=60000)
+        # pending long past its deadline, but the lease is held
+        await self.redis.zadd(PENDING_KEY, {GROUP_ID: 0})
+        sweeper = self.replica()
+        sweeper.start()
+        await asyncio.sleep(0.2)
+        self.assertEqual(sweeper._groups, {})
+        self.assertEqual(await self.redis.get(f"media_group_lease:{GROUP_ID}"), owner.token)
@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from unittest import mock
+from aiogram.exceptions import TelegramRetryAfter
+from config import settings
+from services.messaging.outbound_scheduler import OutboundScheduler, Priority, withPriority
+
+CHANNEL_ID = -1001
+
+class FakeMethod:
+    __api_method__ = "sendMessage"
+
+    def __init__(self, chatId):
+        self.chat_id = chatId
+
+class OutboundSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.scheduler = OutboundScheduler(channelId=CHANNEL_ID)
+        self.sent = []
+
+    async def asyncTearDown(self):
+        await self.scheduler.close()
+
+    async def makeRequest(self, bot, method):
+        self.sent.append(method.chat_id)
+        return "ok"
+
+    def send(self, chatId, priority: Priority | None = None) -> asyncio.Task:
+        async def call():
+            if priority is None:
+                return await self.scheduler(self.makeRequest, None, FakeMethod(chatId))
+            with withPriority(priority):
+                return await self.scheduler(self.makeRequest, None, FakeMethod(chatId))
+        return asyncio.create_task(call())
+
+    async def testLaneOrdering(self):
+        # hold everything back until all three are queued
+        self.scheduler.globalBucket.block(0.1)
+        tasks = [self.send(2, Priority.LOW), self.send(1), self.send(CHANNEL_ID)]
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.sent, [CHANNEL_ID, 1, 2])
+
+    async def testChatOutOfBudgetDoesNotBlockLane(self):
+        self.scheduler._getChatBucket("1").block(0.3)
+        slow, fast = self.send(1), self.send(2)
+        await fast
+        self.assertEqual(self.sent, [2])
+        await slow
+        self.assertEqual(self.sent, [2, 1])
+
+    async def testExemptMethodsBypassQueue(self):
+        self.scheduler.globalBucket.block(60)
+        method = FakeMethod(1)
+        method.__api_method__ = "getChatMember"
+        self.assertEqual(await asyncio.wait_for(self.scheduler(self.makeRequest, None, method), 1), "ok")
+
+    async def testRetryAfterRequeues(self):
+        calls = 0
+        async def floodOnce(bot, method):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise TelegramRetryAfter(method, "flood", retry_after=1)
+            return "ok"
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.assertEqual(await self.scheduler(floodOnce, None, FakeMethod(1)), "ok")
+        self.assertGreaterEqual(loop.time() - started, 0.9)
+        self.assertEqual((calls, self.scheduler.retries), (2, 1))
+        # one short wait in one chat is not a bot-wide flood
+        self.assertEqual(self.scheduler.globalBlocks, 0)
+
+    async def testLongRetryAfterRaisesAndBlocksGlobally(self):
+        async def flood(bot, method):
+            raise TelegramRetryAfter(method, "flood", retry_after=int(settings.OUTBOUND_MAX_RETRY_AFTER_SECONDS) + 1)
+        with self.assertRaises(TelegramRetryAfter):
+            await self.scheduler(flood, None, FakeMethod(1))
+        self.assertGreater(self.scheduler._getChatBucket("1").waitTime(), 60)
+        self.assertGreater(self.scheduler.globalBucket.waitTime(), 60)
+        self.assertEqual(self.scheduler.globalBlocks, 1)
+
+    async def testRetryAfterInSeveralChatsBlocksGlobally(self):
+        async def flood(bot, method):
+            raise TelegramRetryAfter(method, "flood", retry_after=2)
+        with mock.patch.object(settings, "OUTBOUND_MAX_RETRIES", 0):
+            with self.assertRaises(TelegramRetryAfter):
+                await self.scheduler(flood, None, FakeMethod(1))
+            self.assertEqual(self.scheduler.globalBucket.waitTime(), 0)
+            with self.assertRaises(TelegramRetryAfter):
+                await self.scheduler(flood, None, FakeMethod(2))
+        self.assertGreater(self.scheduler.globalBucket.waitTime(), 1)
+        self.assertEqual(self.scheduler.globalBlocks, 1)
+
+    async def testDeleteNotStarvedBySendBudget(self):
+        # a channel that has used up its post budget still gets its deletes/edits through
+        sendBucket = self.scheduler._getChatBucket(str(CHANNEL_ID))
+        while sendBucket.waitTime() == 0:
+            sendBucket.take()
+        queuedPost = self.send(CHANNEL_ID)
+        method = FakeMethod(CHANNEL_ID)
+        method.__api_method__ = "deleteMessage"
+        self.assertEqual(await asyncio.wait_for(self.scheduler(self.makeRequest, None, method), 1), "ok")
+        self.assertFalse(queuedPost.done())
+        queuedPost.cancel()
@@ -0,0 +1,77 @@
+import unittest
+import fakeredis.aioredis
+from exceptions import RateLimitExceeded
+from services.rate_limiting import RateLimiterService, TokenBucketRateLimiter
+
+USER_ID = 42
+
+class SlidingWindowTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.limiter = RateLimiterService(self.redis, limit=3, window=60)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def testLimit(self):
+        results = [await self.limiter.acquire(USER_ID) for _ in range(4)]
+        self.assertEqual([r.allowed for r in results], [True, True, True, False])
+        self.assertEqual(results[2].count, 3)
+        self.assertFalse(results[3].charged)
+        self.assertGreaterEqual(results[3].retryAfter, 1)
+        with self.assertRaises(RateLimitExceeded):
+            await self.limiter.checkRateLimit(USER_ID)
+        self.assertEqual(await self.limiter.getMessageCount(USER_ID), 3)
+
+    async def testAlbumChargedOnce(self):
+        first = await self.limiter.acquire(USER_ID, groupId="album")
+        siblings = [await self.limiter.acquire(USER_ID, groupId="album") for _ in range(5)]
+        self.assertTrue(first.charged)
+        self.assertTrue(all(r.allowed and not r.charged for r in siblings))
+        self.assertEqual(await self.limiter.getMessageCount(USER_ID), 1)
+
+    async def testRefund(self):
+        results = [await self.limiter.acquire(USER_ID) for _ in range(3)]
+        self.assertFalse((await self.limiter.acquire(USER_ID)).allowed)
+        await self.limiter.refund(USER_ID, results[-1])
+        self.assertEqual(await self.limiter.getMessageCount(USER_ID), 2)
+        self.assertTrue((await self.limiter.acquire(USER_ID)).allowed)
+
+    async def testRefundIgnoresUncharged(self):
+        await self.limiter.acquire(USER_ID, groupId="album")
+        sibling = await self.limiter.acquire(USER_ID, groupId="album")
+        await self.limiter.refund(USER_ID, sibling)
+        self.assertEqual(await self.limiter.getMessageCount(USER_ID), 1)
+
+class TokenBucketTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        # one token per hour - nothing refills during the test
+        self.limiter = TokenBucketRateLimiter(self.redis, limit=1, window=3600, burst=2)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def testBurstThenLimit(self):
+        results = [await self.limiter.acquire(USER_ID) for _ in range(3)]
+        self.assertEqual([r.allowed for r in results], [True, True, False])
+        self.assertGreater(results[2].retryAfter, 60)
+        with self.assertRaises(RateLimitExceeded):
+            self.limiter.ensureAllowed(results[2])
+
+    async def testAlbumChargedOnce(self):
+        first = await self.limiter.acquire(USER_ID, groupId="album")
+        sibling = await self.limiter.acquire(USER_ID, groupId="album")
+        self.assertTrue(first.charged)
+        self.assertTrue(sibling.allowed and not sibling.charged)
+        self.assertTrue((await self.limiter.acquire(USER_ID)).allowed)
+        self.assertFalse((await self.limiter.acquire(USER_ID)).allowed)
+
+    async def testRefundReturnsTokenAndAlbumMarker(self):
+        album = await self.limiter.acquire(USER_ID, groupId="album")
+        await self.limiter.acquire(USER_ID)
+        self.assertFalse((await self.limiter.acquire(USER_ID)).allowed)
+        await self.limiter.refund(USER_ID, album)
+        # marker gone -> the album would be charged afresh, and the token is back
+        again = await self.limiter.acquire(USER_ID, groupId="album")
+        self.assertTrue(again.allowed and again.charged)